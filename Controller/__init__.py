@@ -1,6 +1,17 @@
 from PIL import Image
 import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from Model.ImageThumbItem import ImageThumbItem
+from Model.ImageSource import ImageSource
+from Controller.compositors import create_compositor
+from Controller.png_writer import write_png
+from Controller.streaming import STREAM_BACKEND, StreamingCanvas
+from Controller.trim import ALL_SIDES, get_trim_profile
+
+DEFAULT_TRIM_TOLERANCE = 8
+# Formats Pillow writes from RGBX images without converting them to RGB first.
+RGBX_FORMATS = ('JPEG', 'WEBP')
 
 
 def smart_crop_image(image_handle):
@@ -57,64 +68,338 @@ def create_thumb_item(image_path, size=64):
     return ImageThumbItem(base_name, full_path, thumb)
 
 
-def create_composite_image(image_array, orientation='vertical', alignment='left'):
+def _read_size(img):
     """
-    Creates a composite image in which each image is stacked top to bottom
-    or side-by-side. The resulting image is stored in memory.
-    :param image_array:
-    :type image_array: list(str)
+    Reads the dimensions of an image from its header without decoding the pixel data.
+    :param img: The image to inspect.
+    :type img: Model.ImageThumbItem or Model.ImageSource
+    :return: tuple(int, int) - The width and height of the image.
+    """
+    with img.open() as img_handle:
+        return img_handle.size
+
+
+def _scaled_size(size, target, is_vert):
+    """
+    Calculates the size of an image once it has been scaled to a common width (vertical stacks)
+    or a common height (horizontal stacks). The aspect ratio is preserved.
+    :param size: The original width and height of the image.
+    :type size: tuple(int, int)
+    :param target: The common width or height to scale to.
+    :type target: int
+    :param is_vert: True if the images are stacked top to bottom.
+    :type is_vert: bool
+    :return: tuple(int, int) - The scaled width and height.
+    """
+    width, height = size
+    if is_vert:
+        return target, max(1, round(height * target / width))
+    return max(1, round(width * target / height)), target
+
+
+def _load_image(img, size=None, crop=None):
+    """
+    Decodes an image as RGB, optionally cropping it and scaling it to the requested size.
+    When shrinking, the image is first reduced while it is decoded (JPEG draft mode) or by an
+    integer factor (Image.reduce) so the final resample only has to work on a small image.
+    :param img: The image to load.
+    :type img: Model.ImageThumbItem or Model.ImageSource
+    :param size: The width and height of the result. (default is the size of the cropped region)
+    :type size: tuple(int, int)
+    :param crop: The (left, upper, right, lower) region of the original image to keep. (default is all of it)
+    :type crop: tuple(int, int, int, int)
+    :return: PIL.Image
+    """
+    with img.open() as img_handle:
+        original_width, original_height = img_handle.size
+        if crop is None or crop == (0, 0, original_width, original_height):
+            crop = None
+            crop_width, crop_height = original_width, original_height
+        else:
+            crop_width, crop_height = crop[2] - crop[0], crop[3] - crop[1]
+        if size is None or size == (crop_width, crop_height):
+            img_handle = img_handle.convert('RGB')
+            return img_handle if crop is None else img_handle.crop(crop)
+
+        if img_handle.format == 'JPEG' and img.can_draft:
+            img_handle.draft('RGB', (size[0] * original_width // crop_width, size[1] * original_height // crop_height))
+        img_handle = img_handle.convert('RGB')
+        if crop is not None:
+            # Draft mode may have decoded at a fraction of the original size.
+            scale_x = img_handle.width / original_width
+            scale_y = img_handle.height / original_height
+            img_handle = img_handle.crop((int(crop[0] * scale_x), int(crop[1] * scale_y),
+                                          max(int(crop[0] * scale_x) + 1, round(crop[2] * scale_x)),
+                                          max(int(crop[1] * scale_y) + 1, round(crop[3] * scale_y))))
+
+        factor = min(img_handle.width // size[0], img_handle.height // size[1])
+        if factor >= 2:
+            img_handle = img_handle.reduce(factor)
+        return img_handle.resize(size, Image.LANCZOS)
+
+
+def compute_layout(image_array, orientation='vertical', alignment='left', normalize=False, sizes=None,
+                   trim=False, trim_tolerance=DEFAULT_TRIM_TOLERANCE, trim_sides=ALL_SIDES):
+    """
+    Works out where each image will be placed in the composition. Only the image headers are read,
+    unless trimming needs an image's borders measured for the first time.
+    :param image_array: The images to be stacked, in order.
+    :type image_array: list(Model.ImageThumbItem)
     :param orientation: (default is 'vertical')
     :type orientation: str
     :param alignment: (default is 'left')
     :type alignment: str
-    :return: PIL.Image
+    :param normalize: Scale every image to the narrowest width (vertical) or the shortest height
+        (horizontal) in the composition. (default is False)
+    :type normalize: bool
+    :param sizes: The original (width, height) of each image, if they have already been read.
+    :type sizes: list(tuple(int, int))
+    :param trim: Remove uniform margins from the images before stacking them. (default is False)
+    :type trim: bool
+    :param trim_tolerance: How far (0-255) a pixel may differ from the border colour and still be margin.
+    :type trim_tolerance: int
+    :param trim_sides: The sides to trim: any combination of 't'op, 'b'ottom, 'l'eft and 'r'ight.
+    :type trim_sides: str
+    :return: tuple - The (width, height) of the composition and a list of (image, box, crop) triples where
+        box is the (left, upper, right, lower) region the image occupies and crop is the region of the
+        original image that fills it.
     """
 
     is_vert = orientation == 'vertical'
-    out_size_v = 0
-    out_size_h = 0
-    largest_width = 0
-    largest_height = 0
-
-    # This first pass discovers information about each file provided.
-    for img in image_array:
-        with open(img.full_name, 'rb') as file_pointer:
-            img_handle = Image.open(file_pointer)
-            out_size_v += img_handle.height
-            out_size_h += img_handle.width
-            largest_width = max(largest_width, img_handle.width)
-            largest_height = max(largest_height, img_handle.height)
+    if sizes is None:
+        sizes = [_read_size(img) for img in image_array]
 
-    if is_vert:
-        out_image = Image.new('RGB', (largest_width, out_size_v))
+    if trim:
+        crops = [get_trim_profile(img).content_box(trim_tolerance, trim_sides) for img in image_array]
     else:
-        out_image = Image.new('RGB', (out_size_h, largest_height))
+        crops = [(0, 0, width, height) for width, height in sizes]
+    sizes = [(crop[2] - crop[0], crop[3] - crop[1]) for crop in crops]
+
+    if normalize and sizes:
+        target = min(size[0] if is_vert else size[1] for size in sizes)
+        sizes = [_scaled_size(size, target, is_vert) for size in sizes]
+
+    largest_width = max((size[0] for size in sizes), default=0)
+    largest_height = max((size[1] for size in sizes), default=0)
+
+    placements = []
     img_cursor = 0
-    for img in image_array:
-        with open(img.full_name, 'rb') as file_pointer:
-            img_handle = Image.open(file_pointer).convert('RGB')
-
-            if is_vert:
-                if alignment == 'left':
-                    x_offset = 0
-                elif alignment == 'right':
-                    x_offset = largest_width - img_handle.width
-                else:
-                    x_offset = int((largest_width - img_handle.width) / 2)
-
-                out_image.paste(img_handle, box=(x_offset, img_cursor,
-                                                 img_handle.width + x_offset, img_handle.height + img_cursor))
-                img_cursor += img_handle.height
+    for img, (width, height), crop in zip(image_array, sizes, crops):
+        if is_vert:
+            if alignment == 'left':
+                x_offset = 0
+            elif alignment == 'right':
+                x_offset = largest_width - width
+            else:
+                x_offset = int((largest_width - width) / 2)
+
+            placements.append((img, (x_offset, img_cursor, width + x_offset, height + img_cursor), crop))
+            img_cursor += height
+        else:
+            if alignment == 'left':
+                y_offset = 0
+            elif alignment == 'right':
+                y_offset = largest_height - height
             else:
+                y_offset = int((largest_height - height) / 2)
+
+            placements.append((img, (img_cursor, y_offset, width + img_cursor, height + y_offset), crop))
+            img_cursor += width
+
+    if is_vert:
+        return (largest_width, img_cursor), placements
+    return (img_cursor, largest_height), placements
+
 
-                if alignment == 'left':
-                    y_offset = 0
-                elif alignment == 'right':
-                    y_offset = largest_height - img_handle.height
-                else:
-                    y_offset = int((largest_height - img_handle.height) / 2)
-
-                out_image.paste(img_handle, box=(img_cursor, y_offset,
-                                                 img_handle.width + img_cursor, img_handle.height + y_offset))
-                img_cursor += img_handle.width
-    return out_image
+def _iter_loaded(placements, workers=1):
+    """
+    Decodes the images of a layout in order, yielding each one with the box it belongs in.
+    With more than one worker, up to that many of the following images are decoded in the background
+    while the current one is pasted. Pillow releases the GIL while decoding, so threads are enough.
+    :param placements: The (image, box, crop) triples from compute_layout.
+    :type placements: list(tuple)
+    :param workers: The number of images to decode at the same time. (default is 1)
+    :type workers: int
+    :return: generator(tuple(tuple, PIL.Image))
+    """
+
+    def load(placement):
+        img, box, crop = placement
+        return _load_image(img, (box[2] - box[0], box[3] - box[1]), crop)
+
+    if workers <= 1:
+        for placement in placements:
+            yield placement[1], load(placement)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for placement in placements:
+            if len(pending) >= workers:
+                box, future = pending.popleft()
+                yield box, future.result()
+            pending.append((placement[1], executor.submit(load, placement)))
+        while pending:
+            box, future = pending.popleft()
+            yield box, future.result()
+
+
+def create_composite_image(image_array, orientation='vertical', alignment='left', normalize=False,
+                           backend='pil', temp_dir=None, workers=1, **trim_options):
+    """
+    Creates a composite image in which each image is stacked top to bottom
+    or side-by-side.
+    :param image_array:
+    :type image_array: list(Model.ImageThumbItem or Model.ImageSource)
+    :param orientation: (default is 'vertical')
+    :type orientation: str
+    :param alignment: (default is 'left')
+    :type alignment: str
+    :param normalize: Scale every image to a common width (vertical) or height (horizontal).
+        (default is False)
+    :type normalize: bool
+    :param backend: The compositor that builds the canvas. 'pil' and 'numpy' keep it in memory,
+        'memmap' keeps it in a temporary file. (default is 'pil')
+    :type backend: str
+    :param temp_dir: The directory for the 'memmap' backend's canvas file. (default is the system temp dir)
+    :type temp_dir: str
+    :param workers: The number of images to decode in parallel. (default is 1)
+    :type workers: int
+    :param trim_options: trim, trim_tolerance and trim_sides, as accepted by compute_layout.
+    :return: PIL.Image
+    """
+
+    canvas_size, placements = compute_layout(image_array, orientation, alignment, normalize, **trim_options)
+    return compose_layout(canvas_size, placements, backend, temp_dir, workers)
+
+
+def compose_layout(canvas_size, placements, backend='pil', temp_dir=None, workers=1):
+    """
+    Builds a composition from a layout that has already been computed.
+    :param canvas_size: The width and height of the canvas.
+    :type canvas_size: tuple(int, int)
+    :param placements: The (image, box, crop) triples from compute_layout.
+    :type placements: list(tuple)
+    :param backend: The compositor that builds the canvas. (default is 'pil')
+    :type backend: str
+    :param temp_dir: The directory for the 'memmap' backend's canvas file. (default is the system temp dir)
+    :type temp_dir: str
+    :param workers: The number of images to decode in parallel. (default is 1)
+    :type workers: int
+    :return: PIL.Image
+    """
+    return _compose(canvas_size, placements, backend, temp_dir, workers).result()
+
+
+def _compose(canvas_size, placements, backend='pil', temp_dir=None, workers=1):
+    """
+    Pastes every image onto a new canvas.
+    :return: Controller.compositors.Compositor - The filled canvas.
+    """
+    compositor = create_compositor(backend, canvas_size, temp_dir=temp_dir)
+    for box, img_handle in _iter_loaded(placements, workers):
+        compositor.paste(img_handle, box)
+    return compositor
+
+
+def _compose_for_writing(canvas_size, placements, backend='pil', temp_dir=None, workers=1):
+    """
+    Prepares a composition for write_image. The 'stream' backend builds nothing up front: its bands are
+    put together as the PNG encoder reads them.
+    :return: tuple - The image to write, and the release_rows callable to pass to write_image with it.
+    """
+    if backend == STREAM_BACKEND:
+        return StreamingCanvas(canvas_size, placements, workers), None
+    compositor = _compose(canvas_size, placements, backend, temp_dir, workers)
+    return compositor.result(), compositor.release_rows
+
+
+def as_image_source(source):
+    """
+    Wraps anything that can be stacked so it can be used with the rest of the controller.
+    :param source: A path, encoded bytes, a binary file-like object, a PIL Image, or an image that
+        is already wrapped.
+    :return: Model.ImageThumbItem or Model.ImageSource
+    """
+    if isinstance(source, (ImageThumbItem, ImageSource)):
+        return source
+    return ImageSource(source)
+
+
+def format_for_path(path, default='PNG'):
+    """
+    Picks the image format that matches a file name's extension.
+    :param path: The file name.
+    :type path: str
+    :param default: The format to use if the extension is not recognized. (default is 'PNG')
+    :type default: str
+    :return: str - A Pillow format name, such as 'PNG' or 'JPEG'.
+    """
+    return Image.registered_extensions().get(os.path.splitext(path)[1].lower(), default)
+
+
+def write_image(image, stream, image_format='PNG', png_level=6, png_chunk_rows=256, workers=None,
+                release_rows=None):
+    """
+    Encodes an image to a stream. PNGs are written with the multi-threaded encoder in Controller.png_writer,
+    and every other format with Pillow. RGBX images, as built by the NumPy canvases, are only copied to RGB
+    for formats that cannot store them directly.
+    :param image: The image to encode.
+    :type image: PIL.Image
+    :param stream: A writable binary stream. It does not need to be seekable.
+    :param image_format: A Pillow format name. (default is 'PNG')
+    :type image_format: str
+    :param png_level: zlib compression level from 0 to 9 for PNGs. (default is 6)
+    :type png_level: int
+    :param png_chunk_rows: The number of rows compressed by each PNG encoding task. (default is 256)
+    :type png_chunk_rows: int
+    :param workers: The number of PNG encoding threads. (default is the number of CPUs)
+    :type workers: int
+    :param release_rows: Called as a PNG encoder finishes reading each band of rows, such as
+        Compositor.release_rows. (default is None)
+    :type release_rows: callable
+    :return: None
+    """
+    if not isinstance(image, Image.Image) and image_format.upper() != 'PNG':
+        raise ValueError(f'A streamed composition can only be written as a PNG, not {image_format}.')
+    if image_format.upper() == 'PNG':
+        write_png(image, stream, level=png_level, chunk_rows=png_chunk_rows, workers=workers,
+                  release_rows=release_rows)
+    else:
+        if image.mode == 'RGBX' and image_format.upper() not in RGBX_FORMATS:
+            image = image.convert('RGB')
+        image.save(stream, format=image_format)
+
+
+def stack_images(sources, stream, image_format='PNG', orientation='vertical', alignment='left', normalize=False,
+                 backend='pil', temp_dir=None, workers=1, png_level=6, png_chunk_rows=256, encode_workers=None,
+                 **trim_options):
+    """
+    Stacks images from any mix of paths, encoded bytes, binary file-like objects and PIL images, and writes
+    the encoded composition to a stream. Nothing touches the disk unless the 'memmap' backend is used.
+    The image headers are read up front to lay out the composition, but each image is only decoded
+    once the compositor reaches it.
+    :param sources: The images to be stacked, in order.
+    :type sources: iterable
+    :param stream: A writable binary stream, such as an open file, io.BytesIO or sys.stdout.buffer.
+    :param image_format: A Pillow format name. (default is 'PNG')
+    :type image_format: str
+    :param backend: One of the canvases accepted by create_composite_image, or 'stream' to build each band
+        of rows only as the PNG encoder reads it. Streaming only writes PNGs. (default is 'pil')
+    :type backend: str
+    :param workers: The number of images to decode in parallel. (default is 1)
+    :type workers: int
+    :param encode_workers: The number of PNG encoding threads. (default is the number of CPUs)
+    :type encode_workers: int
+    :param trim_options: trim, trim_tolerance and trim_sides, as accepted by compute_layout.
+        The remaining parameters are the same as create_composite_image and write_image.
+    :return: None
+    :raises ValueError: If there are no sources.
+    """
+    image_array = [as_image_source(source) for source in sources]
+    if not image_array:
+        raise ValueError('There are no images to stack.')
+    canvas_size, placements = compute_layout(image_array, orientation, alignment, normalize, **trim_options)
+    image, release_rows = _compose_for_writing(canvas_size, placements, backend, temp_dir, workers)
+    write_image(image, stream, image_format, png_level=png_level, png_chunk_rows=png_chunk_rows,
+                workers=encode_workers, release_rows=release_rows)
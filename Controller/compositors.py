@@ -0,0 +1,139 @@
+import mmap
+import tempfile
+from PIL import Image
+
+
+class Compositor(object):
+    """
+    Base class for a canvas that images are pasted onto to build a composition.
+    Subclasses decide where the canvas lives and how pixels are copied into it.
+    """
+
+    name = None
+
+    def __init__(self, size, **kwargs):
+        """
+        Allocates a black RGB canvas.
+        :param size: The width and height of the canvas.
+        :type size: tuple(int, int)
+        """
+        self.size = size
+
+    def paste(self, image, box):
+        """
+        Copies an image onto the canvas.
+        :param image: An RGB image the same size as the box.
+        :type image: PIL.Image
+        :param box: The (left, upper, right, lower) region to fill.
+        :type box: tuple(int, int, int, int)
+        :return: None
+        """
+        raise NotImplementedError()
+
+    def result(self):
+        """
+        Gets the finished composition.
+        :return: PIL.Image
+        """
+        raise NotImplementedError()
+
+    def release_rows(self, top, bottom):
+        """
+        Tells the canvas that a run of rows has been copied out and will not be read again soon.
+        Only canvases kept on disk do anything with it.
+        :param top: The first row.
+        :type top: int
+        :param bottom: The row after the last.
+        :type bottom: int
+        :return: None
+        """
+
+
+class PilCompositor(Compositor):
+    """
+    Builds the canvas in memory with PIL.Image.paste.
+    """
+
+    name = 'pil'
+
+    def __init__(self, size, **kwargs):
+        super(PilCompositor, self).__init__(size)
+        self.canvas = Image.new('RGB', size)
+
+    def paste(self, image, box):
+        self.canvas.paste(image, box=box)
+
+    def result(self):
+        return self.canvas
+
+
+class NumpyCompositor(Compositor):
+    """
+    Builds the canvas as a (height, width, 4) uint8 RGBX array using slice assignment.
+    The finished image is an RGBX image that shares the array's memory instead of copying it. Pillow can
+    only map buffers with a layout it uses itself, which rules out 3 byte RGB.
+    """
+
+    name = 'numpy'
+
+    def __init__(self, size, **kwargs):
+        super(NumpyCompositor, self).__init__(size)
+        self.canvas = self._allocate(size, **kwargs)
+
+    def _allocate(self, size, **kwargs):
+        import numpy
+        return numpy.zeros((size[1], size[0], 4), dtype=numpy.uint8)
+
+    def paste(self, image, box):
+        import numpy
+        self.canvas[box[1]:box[3], box[0]:box[2], :3] = numpy.asarray(image)
+
+    def result(self):
+        return Image.frombuffer('RGBX', self.size, self.canvas, 'raw', 'RGBX', 0, 1)
+
+
+class MemmapCompositor(NumpyCompositor):
+    """
+    A NumPy canvas backed by a temporary file with np.memmap, so the operating system can page it out.
+    Use it for compositions that do not fit in memory. The file is removed once the canvas is released.
+    The rows of each image are unmapped as soon as it is pasted, and the encoder releases rows as it reads
+    them, so only the rows being worked on are resident.
+    """
+
+    name = 'memmap'
+
+    def paste(self, image, box):
+        super(MemmapCompositor, self).paste(image, box)
+        self.release_rows(box[1], box[3])
+
+    def release_rows(self, top, bottom):
+        backing_map = getattr(self.canvas, '_mmap', None)
+        if backing_map is not None and hasattr(mmap, 'MADV_DONTNEED'):
+            row_bytes = self.size[0] * 4
+            start = top * row_bytes // mmap.PAGESIZE * mmap.PAGESIZE
+            # Shared file pages keep their contents in the page cache, which writes them back to the file.
+            backing_map.madvise(mmap.MADV_DONTNEED, start, bottom * row_bytes - start)
+
+    def _allocate(self, size, temp_dir=None, **kwargs):
+        import numpy
+        # The mapping keeps the data reachable after the (already unlinked) file is closed.
+        with tempfile.TemporaryFile(dir=temp_dir, suffix='.canvas') as backing_file:
+            return numpy.memmap(backing_file, dtype=numpy.uint8, mode='w+', shape=(size[1], size[0], 4))
+
+
+COMPOSITORS = {compositor.name: compositor for compositor in (PilCompositor, NumpyCompositor, MemmapCompositor)}
+
+
+def create_compositor(backend, size, **kwargs):
+    """
+    Creates a canvas using the named backend.
+    :param backend: One of the names in COMPOSITORS: 'pil', 'numpy' or 'memmap'.
+    :type backend: str
+    :param size: The width and height of the canvas.
+    :type size: tuple(int, int)
+    :param kwargs: Backend specific options, such as temp_dir for 'memmap'.
+    :return: Compositor
+    """
+    if backend not in COMPOSITORS:
+        raise ValueError(f'Unknown compositor backend "{backend}". Choose from {", ".join(COMPOSITORS)}.')
+    return COMPOSITORS[backend](size, **kwargs)
@@ -0,0 +1,279 @@
+import logging
+import os
+import shutil
+import tempfile
+import Controller
+from Controller import png_writer
+from Controller.streaming import STREAM_BACKEND, images_per_band
+
+# Pillow stores RGB images with 4 bytes per pixel, and the NumPy canvases are RGBX.
+PIL_BYTES_PER_PIXEL = 4
+ARRAY_BYTES_PER_PIXEL = 4
+# numpy.asarray copies a decoded image as 3 byte RGB before it is pasted onto a NumPy canvas.
+PASTE_BYTES_PER_PIXEL = 3
+
+STRATEGY_MEMORY = 'memory'
+STRATEGY_STREAMING = 'streaming'
+STRATEGY_OUT_OF_CORE = 'out_of_core'
+
+
+class ResourceBudgetError(Exception):
+    """
+    Raised when a job cannot be run within the configured resource budget.
+    """
+
+
+class JobEstimate(object):
+    """
+    Data class describing how much memory a composition will need, worked out from the image headers.
+    """
+
+    def __init__(self, canvas_size, image_sizes, largest_decode_bytes, largest_box=(0, 0), boxes=None):
+        """
+        :param canvas_size: The width and height of the finished composition.
+        :param image_sizes: The original width and height of each image.
+        :param largest_decode_bytes: The memory needed to decode (and scale) the largest single image.
+        :param largest_box: The width and height of the largest image as it is placed on the canvas.
+        :param boxes: The (left, upper, right, lower) region of each image on the canvas. Without them the
+            composition is not considered for streaming.
+        """
+        self.canvas_size = canvas_size
+        self.image_sizes = image_sizes
+        self.largest_decode_bytes = largest_decode_bytes
+        self.largest_box = largest_box
+        self.boxes = boxes
+
+    @property
+    def canvas_pixels(self):
+        return self.canvas_size[0] * self.canvas_size[1]
+
+    @property
+    def largest_box_pixels(self):
+        return self.largest_box[0] * self.largest_box[1]
+
+
+class ExecutionPlan(object):
+    """
+    Data class describing how a job should be run.
+    """
+
+    def __init__(self, strategy, backend, workers, estimated_bytes):
+        """
+        :param strategy: One of STRATEGY_MEMORY, STRATEGY_STREAMING or STRATEGY_OUT_OF_CORE.
+        :param backend: The compositor backend to build the canvas with.
+        :param workers: The number of images to decode in parallel.
+        :param estimated_bytes: The peak memory the plan is expected to use.
+        """
+        self.strategy = strategy
+        self.backend = backend
+        self.workers = workers
+        self.estimated_bytes = estimated_bytes
+
+    def composite_options(self):
+        """
+        Gets the keyword arguments that run this plan with Controller.create_composite_image.
+        :return: dict
+        """
+        return {'backend': self.backend, 'workers': self.workers}
+
+
+class ResourceGovernor(object):
+    """
+    Chooses how to run each job so it stays within a memory budget.
+    - memory: canvas in RAM, several images decoded in parallel.
+    - streaming: no canvas; PNG bands are put together as they are encoded, so only the images in the
+      current band are held. Suits tall vertical stacks.
+    - out_of_core: a memory mapped canvas on disk in temp_dir, images decoded in parallel.
+    Jobs that do not fit any of these are refused with a ResourceBudgetError.
+    """
+
+    def __init__(self, memory_budget, workers=None, temp_dir=None):
+        """
+        :param memory_budget: The most memory, in bytes, a single job may use.
+        :type memory_budget: int
+        :param workers: The most images to decode in parallel. (default is the number of CPUs)
+        :type workers: int
+        :param temp_dir: Where out-of-core canvases are kept. (default is the system temp dir)
+        :type temp_dir: str
+        """
+        self.memory_budget = memory_budget
+        self.workers = max(1, workers or os.cpu_count() or 1)
+        self.temp_dir = temp_dir or None
+
+    @classmethod
+    def from_config(cls, section):
+        """
+        Creates a governor from the [performance] section of the config file.
+        :param section: The config section.
+        :type section: configparser.SectionProxy
+        :return: ResourceGovernor
+        """
+        return cls(config_int(section, 'memory_budget_mb', 1024, minimum=1) * 1024 * 1024,
+                   workers=config_int(section, 'workers', 0),
+                   temp_dir=section.get('temp_dir', fallback=''))
+
+    def estimate(self, image_array, orientation='vertical', alignment='left', normalize=False, **trim_options):
+        """
+        Estimates the memory a composition needs. Only the image headers are read, apart from measuring
+        borders for trimming the first time it is used on an image.
+        :param image_array: The images to be stacked, in order.
+        :type image_array: list(Model.ImageThumbItem)
+        :param trim_options: trim, trim_tolerance and trim_sides, as accepted by Controller.compute_layout.
+        :return: JobEstimate
+        """
+        sizes = [Controller._read_size(img) for img in image_array]
+        canvas_size, placements = Controller.compute_layout(image_array, orientation, alignment, normalize,
+                                                            sizes=sizes, **trim_options)
+        return self.estimate_layout(canvas_size, placements, sizes)
+
+    def estimate_layout(self, canvas_size, placements, sizes):
+        """
+        Estimates the memory needed to build a layout that has already been computed.
+        :param canvas_size: The width and height of the canvas.
+        :type canvas_size: tuple(int, int)
+        :param placements: The (image, box, crop) triples from Controller.compute_layout.
+        :type placements: list(tuple)
+        :param sizes: The original width and height of each image.
+        :type sizes: list(tuple(int, int))
+        :return: JobEstimate
+        """
+        largest_decode = 0
+        largest_box = (0, 0)
+        for (width, height), (img, box, crop) in zip(sizes, placements):
+            box_size = (box[2] - box[0], box[3] - box[1])
+            decode = width * height * PIL_BYTES_PER_PIXEL
+            if crop != (0, 0, width, height) or box_size != (width, height):
+                decode += box_size[0] * box_size[1] * PIL_BYTES_PER_PIXEL
+            largest_decode = max(largest_decode, decode)
+            largest_box = max(largest_box, box_size, key=lambda size: size[0] * size[1])
+        return JobEstimate(canvas_size, sizes, largest_decode, largest_box, [box for img, box, crop in placements])
+
+    def plan(self, estimate, image_format='PNG', png_chunk_rows=256):
+        """
+        Picks the execution strategy and level of parallelism for a job. Building a canvas and encoding it
+        happen one after the other, so the peak is the canvas plus whichever of the two needs more.
+        :param estimate: The estimate from ResourceGovernor.estimate.
+        :type estimate: JobEstimate
+        :param image_format: The Pillow format the composition is saved in. (default is 'PNG')
+        :type image_format: str
+        :param png_chunk_rows: The number of rows compressed by each PNG encoding task. (default is 256)
+        :type png_chunk_rows: int
+        :return: ExecutionPlan
+        :raises ResourceBudgetError: If the job cannot be run within the budget.
+        """
+        decode = max(estimate.largest_decode_bytes, 1)
+        workers = min(self.workers, max(1, len(estimate.image_sizes)))
+        width, height = estimate.canvas_size
+        is_png = image_format.upper() == 'PNG'
+        # Pillow's own encoders only buffer a few rows; RGBX canvases are copied to RGB for formats that need it.
+        encode = png_writer.estimate_memory(width, png_chunk_rows, self.workers) if is_png else 0
+        needs_rgb = not is_png and image_format.upper() not in Controller.RGBX_FORMATS
+        paste = estimate.largest_box_pixels * PASTE_BYTES_PER_PIXEL
+
+        # Each worker holds a decoded image, as does the paste, and the decoders' buffers and heap
+        # fragmentation take about as much again.
+        canvas = estimate.canvas_pixels * PIL_BYTES_PER_PIXEL
+        encode_pil = 0 if png_writer.uses_pillow('RGB', estimate.canvas_size, self.workers) else encode
+        parallel = min(workers, (self.memory_budget - canvas - 1) // (2 * decode) - 1)
+        if parallel >= 1 and canvas + encode_pil < self.memory_budget:
+            return ExecutionPlan(STRATEGY_MEMORY, 'pil', parallel,
+                                 canvas + max(2 * (parallel + 1) * decode, encode_pil))
+
+        # Streaming holds the images that overlap a band, the ones being decoded ahead and about one more
+        # in the decoders' buffers, as well as a band for each encoding thread and the one being put
+        # together. Decoding and encoding overlap, so these add up.
+        if is_png and estimate.boxes:
+            live = images_per_band(estimate.boxes, height, png_chunk_rows)
+            bands = (self.workers + 1) * (max(1, png_chunk_rows) + 1) * width * PIL_BYTES_PER_PIXEL
+            parallel = min(workers, (self.memory_budget - bands - encode - 1) // decode - live - 1)
+            if parallel >= 1:
+                return ExecutionPlan(STRATEGY_STREAMING, STREAM_BACKEND, parallel,
+                                     bands + encode + (live + parallel + 1) * decode)
+
+        canvas = estimate.canvas_pixels * ARRAY_BYTES_PER_PIXEL
+        encode_array = encode + (estimate.canvas_pixels * PIL_BYTES_PER_PIXEL if needs_rgb else 0)
+
+        # On disk, only the rows being pasted or encoded are resident. Pillow's encoders read the whole
+        # canvas back in though, so other formats need it all.
+        window = estimate.largest_box_pixels * ARRAY_BYTES_PER_PIXEL
+        if is_png:
+            encode_window = encode + self.workers * 2 * max(1, png_chunk_rows) * estimate.canvas_size[0] * \
+                ARRAY_BYTES_PER_PIXEL
+        else:
+            encode_window = encode_array + canvas
+        if encode_window >= self.memory_budget:
+            raise ResourceBudgetError(
+                f'Encoding the composition as {image_format} needs {_format_bytes(encode_window)}, which is more '
+                f'than the {_format_bytes(self.memory_budget)} memory budget. Split it into parts.')
+        if 4 * decode + paste + window >= self.memory_budget:
+            raise ResourceBudgetError(
+                f'A single image needs {_format_bytes(4 * decode + paste + window)} to decode and paste, which '
+                f'is more than the {_format_bytes(self.memory_budget)} memory budget.')
+
+        free_disk = shutil.disk_usage(self.temp_dir or tempfile.gettempdir()).free
+        if canvas > free_disk:
+            parts = -(-canvas // (self.memory_budget - 4 * decode - paste))
+            raise ResourceBudgetError(
+                f'The composition needs {_format_bytes(canvas)} but only {_format_bytes(free_disk)} is free '
+                f'in the temporary directory. Split it into at least {parts} parts.')
+
+        parallel = max(1, min(workers, (self.memory_budget - paste - window - 1) // (2 * decode) - 1))
+        return ExecutionPlan(STRATEGY_OUT_OF_CORE, 'memmap', parallel,
+                             max(2 * (parallel + 1) * decode + paste + window, encode_window))
+
+    def plan_parts(self, estimates, image_format='PNG', png_chunk_rows=256):
+        """
+        Plans the parts of a split composition so that as many as possible are built at the same time.
+        The budget is shared equally between the parts running at once.
+        :param estimates: The estimate for each part.
+        :type estimates: list(JobEstimate)
+        :param image_format: The Pillow format the parts are saved in. (default is 'PNG')
+        :type image_format: str
+        :param png_chunk_rows: The number of rows compressed by each PNG encoding task. (default is 256)
+        :type png_chunk_rows: int
+        :return: tuple(int, list(ExecutionPlan)) - How many parts to build at once, and the plan for each part.
+        :raises ResourceBudgetError: If a part cannot be built within the budget even on its own.
+        """
+        parallel = max(1, min(self.workers, len(estimates)))
+        while True:
+            share = ResourceGovernor(self.memory_budget // parallel, workers=max(1, self.workers // parallel),
+                                     temp_dir=self.temp_dir)
+            try:
+                return parallel, [share.plan(estimate, image_format, png_chunk_rows) for estimate in estimates]
+            except ResourceBudgetError:
+                if parallel == 1:
+                    raise
+                parallel -= 1
+
+
+def config_int(section, option, fallback, minimum=0):
+    """
+    Reads a whole number from a config section. Values that are missing, not a number or below the
+    minimum are replaced by the fallback, with a warning for the ones that were set.
+    :param section: The config section.
+    :type section: configparser.SectionProxy
+    :param option: The name of the setting.
+    :type option: str
+    :param fallback: The value to use instead.
+    :type fallback: int
+    :param minimum: The smallest value allowed. (default is 0)
+    :type minimum: int
+    :return: int
+    """
+    try:
+        value = section.getint(option, fallback=fallback)
+    except ValueError:
+        value = None
+    if value is None or value < minimum:
+        logging.getLogger(__name__).warning(f'Ignoring {option} = {section.get(option)} in the config file; '
+                                            f'using {fallback}.')
+        return fallback
+    return value
+
+
+def _format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f'{size:.0f} {unit}'
+        size /= 1024
+    return f'{size:.1f} TB'
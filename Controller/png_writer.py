@@ -0,0 +1,268 @@
+import os
+import struct
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+ADLER_BASE = 65521
+# Deflate looks back at most 32 KiB, so that is all of the previous band a worker needs to see.
+WINDOW_SIZE = 32768
+
+# Images smaller than this are encoded by Pillow; splitting them costs more than it saves.
+PARALLEL_MIN_PIXELS = 1 << 21
+# Working memory of an RGBA band while it is filtered, measured with tracemalloc.
+FILTER_BYTES_PER_PIXEL = 44
+
+# Pillow mode -> (PNG colour type, bytes per pixel)
+_COLOR_TYPES = {
+    'L': (0, 1),
+    'RGB': (2, 3),
+    'RGBX': (2, 3),
+    'RGBA': (6, 4),
+}
+
+
+def write_png(image, stream, level=6, chunk_rows=256, workers=None, release_rows=None):
+    """
+    Encodes an image as a standard 8-bit PNG, filtering and deflating bands of rows in parallel.
+    Like pigz, each band is compressed on its own, primed with the end of the band before it, and the
+    pieces are joined into a single zlib stream. zlib and NumPy release the GIL, so threads scale
+    across cores. Bands are written in order as they finish, which keeps memory use bounded.
+    With a single worker, or an image too small to be worth splitting, Pillow's encoder is used instead
+    as it is faster on one core.
+    :param image: The image to encode. RGBX is written as RGB without copying the image first.
+        Modes other than L, RGB, RGBX and RGBA are converted first. A Controller.streaming.StreamingCanvas
+        can be passed instead, and is read one band at a time.
+    :type image: PIL.Image
+    :param stream: A writable binary stream.
+    :param level: zlib compression level from 0 (none) to 9 (smallest). (default is 6)
+    :type level: int
+    :param chunk_rows: The number of rows compressed by each task. (default is 256)
+    :type chunk_rows: int
+    :param workers: The number of encoding threads. (default is the number of CPUs)
+    :type workers: int
+    :param release_rows: Called with the top and bottom of each band once its rows have been read, so a canvas
+        mapped from disk can let them go. (default is None)
+    :type release_rows: callable
+    :return: None
+    """
+    is_streamed = not isinstance(image, Image.Image)
+    if not is_streamed and image.mode not in _COLOR_TYPES:
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    color_type, depth = _COLOR_TYPES[image.mode]
+    width, height = image.size
+    chunk_rows = max(1, chunk_rows)
+    workers = _worker_count(workers)
+    if not is_streamed and uses_pillow(image.mode, image.size, workers):
+        image.save(stream, format='PNG', compress_level=level)
+        return
+
+    stream.write(PNG_SIGNATURE)
+    _write_chunk(stream, b'IHDR', struct.pack('>IIBBBBB', width, height, 8, color_type, 0, 0, 0))
+    _write_chunk(stream, b'IDAT', _zlib_header(level))
+
+    bands = iter([(top, min(top + chunk_rows, height)) for top in range(0, height, chunk_rows)])
+    adler = 1
+    history = b''
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        filtering = deque()
+        compressing = deque()
+
+        def submit_filters():
+            while len(filtering) < workers:
+                band = next(bands, None)
+                if band is None:
+                    return
+                if is_streamed:
+                    # A streaming canvas builds its bands in order, so they are read here rather than
+                    # by the workers.
+                    rows = image.crop((0, max(0, band[0] - 1), width, band[1]))
+                    filtering.append((band, executor.submit(_filter_rows, rows, band[0] > 0)))
+                else:
+                    filtering.append((band, executor.submit(_filter_band, image, *band)))
+
+        submit_filters()
+        while filtering:
+            (top, bottom), future = filtering.popleft()
+            data = future.result()
+            if release_rows is not None:
+                release_rows(top, bottom)
+            submit_filters()
+            is_last = bottom == height
+            # Prime the window with what the decoder will already have seen, as pigz does.
+            compressing.append(executor.submit(_compress_band, data, history, level, is_last))
+            history = (history + data[-WINDOW_SIZE:])[-WINDOW_SIZE:]
+            while len(compressing) > workers:
+                adler = _write_band(stream, compressing.popleft().result(), adler)
+        while compressing:
+            adler = _write_band(stream, compressing.popleft().result(), adler)
+
+    _write_chunk(stream, b'IDAT', struct.pack('>I', adler))
+    _write_chunk(stream, b'IEND', b'')
+
+
+def uses_pillow(mode, size, workers=None):
+    """
+    Checks whether write_png passes an image to Pillow's encoder, which is faster on a single core and
+    needs next to no memory besides the image. Pillow cannot write RGBX, and converting it would copy the
+    whole canvas, so RGBX is always encoded in bands.
+    :param mode: The mode of the image.
+    :type mode: str
+    :param size: The width and height of the image.
+    :type size: tuple(int, int)
+    :param workers: The number of encoding threads. (default is the number of CPUs)
+    :type workers: int
+    :return: bool
+    """
+    return mode != 'RGBX' and (_worker_count(workers) == 1 or size[0] * size[1] < PARALLEL_MIN_PIXELS)
+
+
+def estimate_memory(width, chunk_rows=256, workers=None):
+    """
+    Estimates the most memory write_png needs on top of the image itself.
+    :param width: The width of the image.
+    :type width: int
+    :param chunk_rows: The number of rows compressed by each task. (default is 256)
+    :type chunk_rows: int
+    :param workers: The number of encoding threads. (default is the number of CPUs)
+    :type workers: int
+    :return: int - The number of bytes.
+    """
+    workers = _worker_count(workers)
+    band_pixels = width * max(1, chunk_rows)
+    # Bands being filtered hold their working arrays; filtered bands wait to be compressed or written.
+    return workers * band_pixels * FILTER_BYTES_PER_PIXEL + 2 * workers * band_pixels * 4
+
+
+def _compress_band(data, zdict, level, is_last):
+    """
+    Deflates one band of filtered rows.
+    :param data: The filtered rows.
+    :param zdict: Up to 32 KiB of the filtered rows before the band.
+    :return: tuple(bytes, int, int) - The raw deflate data, and the Adler-32 and length of the filtered rows.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15, **({'zdict': zdict} if zdict else {}))
+    compressed = compressor.compress(data) + compressor.flush(zlib.Z_FINISH if is_last else zlib.Z_SYNC_FLUSH)
+    return compressed, zlib.adler32(data), len(data)
+
+
+def _worker_count(workers):
+    return max(1, workers or os.cpu_count() or 1)
+
+
+def _filter_band(image, top, bottom):
+    """
+    Applies PNG filtering to the rows from top to bottom of an image.
+    :return: bytes - The filtered rows, each prefixed with its filter type.
+    """
+    return _filter_rows(image.crop((0, max(0, top - 1), image.width, bottom)), top > 0)
+
+
+def _filter_rows(band, has_row_above):
+    """
+    Applies PNG filtering to a band of rows. Each row gets the filter type (None, Sub, Up, Average or Paeth)
+    with the smallest sum of absolute differences, the heuristic recommended by the PNG specification.
+    Each filter is computed for the whole band at once with NumPy, in uint8 so that the arithmetic wraps
+    modulo 256 exactly as the PNG format defines it.
+    :param band: The rows to filter.
+    :type band: PIL.Image
+    :param has_row_above: The first row of the band is the last row of the band before, and is only
+        used as the row above.
+    :type has_row_above: bool
+    :return: bytes - The filtered rows, each prefixed with its filter type.
+    """
+    import numpy
+
+    depth = _COLOR_TYPES[band.mode][1]
+    rows = numpy.asarray(band)
+    if band.mode == 'RGBX':
+        rows = rows[..., :3]
+    rows = rows.reshape(band.height, -1)
+    if has_row_above:
+        current, above = rows[1:], rows[:-1]
+    else:
+        current, above = rows, numpy.vstack((numpy.zeros_like(rows[:1]), rows[:-1]))
+
+    left = numpy.zeros_like(current)
+    left[:, depth:] = current[:, :-depth]
+    upper_left = numpy.zeros_like(above)
+    upper_left[:, depth:] = above[:, :-depth]
+
+    filtered = numpy.empty((current.shape[0], current.shape[1] + 1), dtype=numpy.uint8)
+    filtered[:, 0] = 0
+    filtered[:, 1:] = current
+    best_cost = _filter_cost(current)
+
+    def consider(filter_type, residual):
+        cost = _filter_cost(residual)
+        better = cost < best_cost
+        if better.any():
+            best_cost[better] = cost[better]
+            filtered[better, 0] = filter_type
+            filtered[better, 1:] = residual[better]
+
+    consider(1, current - left)
+    consider(2, current - above)
+    consider(3, current - ((left >> 1) + (above >> 1) + (left & above & 1)))
+
+    # Paeth picks whichever of left, above and upper left is closest to left + above - upper left:
+    # pa = |above - upper_left|, pb = |left - upper_left| and pc = |pa + pb| with the signs kept.
+    # When both differences have the same sign pc is at least pa and pb, so it never wins and its
+    # exact value is not needed; otherwise it is |pa - pb|. This keeps everything in uint8.
+    distance_above = numpy.maximum(above, upper_left) - numpy.minimum(above, upper_left)
+    distance_left = numpy.maximum(left, upper_left) - numpy.minimum(left, upper_left)
+    distance_both = numpy.maximum(distance_above, distance_left) - numpy.minimum(distance_above, distance_left)
+    distance_both[(above >= upper_left) == (left >= upper_left)] = 255
+    paeth = numpy.where((distance_above <= distance_left) & (distance_above <= distance_both), left,
+                        numpy.where(distance_left <= distance_both, above, upper_left))
+    consider(4, current - paeth)
+    return filtered.tobytes()
+
+
+def _filter_cost(residual):
+    """
+    Sums each row of filtered bytes as signed values, so small negative differences count as small.
+    """
+    import numpy
+    return numpy.minimum(residual, 0 - residual).sum(axis=1, dtype=numpy.uint32)
+
+
+def _write_band(stream, band, adler):
+    compressed, band_adler, length = band
+    _write_chunk(stream, b'IDAT', compressed)
+    return _adler32_combine(adler, band_adler, length)
+
+
+def _write_chunk(stream, chunk_type, data):
+    stream.write(struct.pack('>I', len(data)))
+    stream.write(chunk_type)
+    stream.write(data)
+    stream.write(struct.pack('>I', zlib.crc32(chunk_type + data) & 0xffffffff))
+
+
+def _zlib_header(level):
+    """
+    Builds the two byte zlib header for a 32 KiB window at the given compression level.
+    """
+    if level < 2:
+        compression_level = 0
+    elif level < 6:
+        compression_level = 1
+    elif level == 6:
+        compression_level = 2
+    else:
+        compression_level = 3
+    header = (0x78 << 8) | (compression_level << 6)
+    header += 31 - header % 31
+    return struct.pack('>H', header)
+
+
+def _adler32_combine(adler1, adler2, length2):
+    """
+    Combines the Adler-32 checksums of two blocks of data into the checksum of both, one after the other.
+    """
+    sum1 = ((adler1 & 0xffff) + (adler2 & 0xffff) - 1) % ADLER_BASE
+    sum2 = ((adler1 >> 16) + (adler2 >> 16) + length2 * ((adler1 & 0xffff) - 1)) % ADLER_BASE
+    return (sum2 << 16) | sum1
@@ -0,0 +1,243 @@
+import math
+import threading
+from collections import OrderedDict
+from PIL import Image
+import Controller
+
+# Fill for the parts of a tile whose source image has not been loaded yet.
+PLACEHOLDER_COLOR = (96, 96, 96)
+
+
+class LruCache(object):
+    """
+    A thread-safe cache that discards the least recently used entry once it is full.
+    """
+
+    def __init__(self, capacity):
+        """
+        :param capacity: The number of entries to keep.
+        :type capacity: int
+        """
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+
+class ImagePyramid(object):
+    """
+    A multi-resolution view of a composition that is rendered one tile at a time.
+    Level 0 is full size, and each following level is half the size of the one before it.
+    Tiles are built lazily, straight from the source images, the first time they are requested.
+    Sources can be loaded on a worker thread while tiles are drawn from whatever is already loaded.
+    """
+
+    TILE_SIZE = 256
+
+    def __init__(self, image_array, orientation='vertical', alignment='left', normalize=False,
+                 tile_cache_size=256, source_cache_size=16, source_cache=None, **trim_options):
+        """
+        Lays out the composition. Only the image headers are read until a tile is requested.
+        :param image_array: The images to be stacked, in order.
+        :type image_array: list(Model.ImageThumbItem)
+        :param orientation: (default is 'vertical')
+        :type orientation: str
+        :param alignment: (default is 'left')
+        :type alignment: str
+        :param normalize: Scale every image to a common width or height. (default is False)
+        :type normalize: bool
+        :param tile_cache_size: The number of rendered tiles to keep in memory.
+        :type tile_cache_size: int
+        :param source_cache_size: The number of scaled source images to keep in memory.
+        :type source_cache_size: int
+        :param source_cache: A cache of scaled source images to share with other pyramids, so that
+            reordering or realigning a composition does not decode every image again.
+            (default is a new cache of source_cache_size entries)
+        :type source_cache: LruCache
+        :param trim_options: trim, trim_tolerance and trim_sides, as accepted by Controller.compute_layout.
+        """
+        self.size, self.placements = Controller.compute_layout(image_array, orientation, alignment, normalize,
+                                                               **trim_options)
+        self._tiles = LruCache(tile_cache_size)
+        self._partial_tiles = LruCache(tile_cache_size)
+        self._sources = source_cache if source_cache is not None else LruCache(source_cache_size)
+
+        largest_side = max(self.size[0], self.size[1], 1)
+        self.level_count = max(1, math.ceil(math.log2(largest_side / self.TILE_SIZE)) + 1)
+
+    def level_size(self, level):
+        """
+        Gets the size of the whole composition at a pyramid level.
+        :param level: The pyramid level. 0 is full size.
+        :type level: int
+        :return: tuple(int, int)
+        """
+        scale = 2 ** level
+        return max(1, math.ceil(self.size[0] / scale)), max(1, math.ceil(self.size[1] / scale))
+
+    def level_for_scale(self, scale):
+        """
+        Picks the smallest level that still has at least one pixel for every pixel on screen.
+        :param scale: The zoom factor of the view. 1.0 is full size.
+        :type scale: float
+        :return: int
+        """
+        if scale <= 0:
+            return self.level_count - 1
+        level = int(math.floor(math.log2(1 / scale))) if scale < 1 else 0
+        return min(max(level, 0), self.level_count - 1)
+
+    def tile_range(self, level, rect):
+        """
+        Lists the tiles that cover a region of the composition.
+        :param level: The pyramid level.
+        :type level: int
+        :param rect: The (left, upper, right, lower) region in full size coordinates.
+        :type rect: tuple
+        :return: list(tuple(int, int)) - The (column, row) of each tile.
+        """
+        span = self.TILE_SIZE * 2 ** level
+        level_width, level_height = self.level_size(level)
+        last_col = math.ceil(level_width / self.TILE_SIZE) - 1
+        last_row = math.ceil(level_height / self.TILE_SIZE) - 1
+
+        first_col = max(0, int(rect[0] // span))
+        first_row = max(0, int(rect[1] // span))
+        end_col = min(last_col, int(math.ceil(rect[2] / span)) - 1)
+        end_row = min(last_row, int(math.ceil(rect[3] / span)) - 1)
+        return [(col, row) for row in range(first_row, end_row + 1) for col in range(first_col, end_col + 1)]
+
+    def tile(self, level, col, row):
+        """
+        Gets a single tile, rendering it if it is not already cached. Loads any source images it needs.
+        :param level: The pyramid level.
+        :type level: int
+        :param col: The column of the tile.
+        :type col: int
+        :param row: The row of the tile.
+        :type row: int
+        :return: PIL.Image - An RGB image no larger than TILE_SIZE on either side.
+        """
+        tile = self._tiles.get((level, col, row))
+        if tile is None:
+            tile, missing = self._render_tile(level, col, row, loaded_only=False)
+            self._tiles.put((level, col, row), tile)
+        return tile
+
+    def try_tile(self, level, col, row):
+        """
+        Gets a single tile without loading any source images. Images that are not loaded yet are
+        drawn as placeholders. Incomplete tiles are kept and filled in as their images are loaded,
+        so a tile never needs all of its source images to be cached at the same time.
+        :param level: The pyramid level.
+        :type level: int
+        :param col: The column of the tile.
+        :type col: int
+        :param row: The row of the tile.
+        :type row: int
+        :return: tuple(PIL.Image, list(int)) - The tile and the index of each image missing from it.
+        """
+        tile = self._tiles.get((level, col, row))
+        if tile is not None:
+            return tile, []
+
+        partial = self._partial_tiles.get((level, col, row))
+        if partial is None:
+            tile, missing = self._render_tile(level, col, row, loaded_only=True)
+        else:
+            tile, missing = partial
+            for index in list(missing):
+                source = self._sources.get(self._source_key(index, level))
+                if source is not None:
+                    tile.paste(source, box=missing.pop(index))
+
+        if missing:
+            self._partial_tiles.put((level, col, row), (tile, missing))
+        else:
+            self._partial_tiles.discard((level, col, row))
+            self._tiles.put((level, col, row), tile)
+        return tile, list(missing)
+
+    def has_source(self, index, level):
+        """
+        Checks whether an image has already been loaded at a pyramid level.
+        :param index: The position of the image in the composition.
+        :type index: int
+        :param level: The pyramid level.
+        :type level: int
+        :return: bool
+        """
+        return self._source_key(index, level) in self._sources
+
+    def load_source(self, index, level):
+        """
+        Decodes an image at the size it has in a pyramid level, unless it is already loaded.
+        :param index: The position of the image in the composition.
+        :type index: int
+        :param level: The pyramid level.
+        :type level: int
+        :return: PIL.Image
+        """
+        key = self._source_key(index, level)
+        source = self._sources.get(key)
+        if source is None:
+            img, box, crop = self.placements[index]
+            source = Controller._load_image(img, key[2], crop)
+            self._sources.put(key, source)
+        return source
+
+    def _source_key(self, index, level):
+        img, box, crop = self.placements[index]
+        level_box = self._level_box(box, level)
+        return img.full_name, crop, (level_box[2] - level_box[0], level_box[3] - level_box[1])
+
+    def _level_box(self, box, level):
+        scale = 2 ** level
+        left = box[0] // scale
+        upper = box[1] // scale
+        return left, upper, max(left + 1, box[2] // scale), max(upper + 1, box[3] // scale)
+
+    def _render_tile(self, level, col, row, loaded_only):
+        level_width, level_height = self.level_size(level)
+        left = col * self.TILE_SIZE
+        upper = row * self.TILE_SIZE
+        right = min(left + self.TILE_SIZE, level_width)
+        lower = min(upper + self.TILE_SIZE, level_height)
+        tile = Image.new('RGB', (right - left, lower - upper))
+        missing = {}
+
+        for index, (img, box, crop) in enumerate(self.placements):
+            level_box = self._level_box(box, level)
+            if level_box[2] <= left or level_box[0] >= right or level_box[3] <= upper or level_box[1] >= lower:
+                continue
+            offset_box = (level_box[0] - left, level_box[1] - upper, level_box[2] - left, level_box[3] - upper)
+            source = self._sources.get(self._source_key(index, level)) if loaded_only \
+                else self.load_source(index, level)
+            if source is None:
+                missing[index] = offset_box[:2]
+                tile.paste(PLACEHOLDER_COLOR, box=(max(0, offset_box[0]), max(0, offset_box[1]),
+                                                   min(tile.width, offset_box[2]), min(tile.height, offset_box[3])))
+            else:
+                tile.paste(source, box=offset_box[:2])
+        return tile, missing
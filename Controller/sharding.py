@@ -0,0 +1,187 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import Controller
+
+# Largest width or height a JPEG can hold; also a sensible default for formats without a hard limit.
+DEFAULT_MAX_DIMENSION = 65535
+# Formats that cannot store images above a certain width or height.
+FORMAT_MAX_DIMENSIONS = {
+    'JPEG': 65535,
+    'WEBP': 16383,
+}
+# Bytes per pixel of the canvas a part is measured against. Pillow stores RGB in 4 bytes and the NumPy
+# canvases are RGBX.
+CANVAS_BYTES_PER_PIXEL = 4
+
+
+class Shard(object):
+    """
+    Data class describing one part of a split composition: a run of consecutive images, laid out exactly as
+    they are in the whole composition. Every part keeps the full width (vertical) or height (horizontal),
+    so the parts line up again when they are placed end to end.
+    """
+
+    def __init__(self, index, offset, size, placements, sizes):
+        """
+        :param index: The position of the part, starting at 0.
+        :param offset: The (x, y) of the part's top left corner in the whole composition.
+        :param size: The width and height of the part.
+        :param placements: The (image, box, crop) triples of the images in the part, relative to the part.
+        :param sizes: The original width and height of each image in the part.
+        """
+        self.index = index
+        self.offset = offset
+        self.size = size
+        self.placements = placements
+        self.sizes = sizes
+
+
+def max_dimension_for(image_format, max_dimension=None):
+    """
+    Gets the largest width or height a part may have when it is saved in a format.
+    :param image_format: A Pillow format name, such as 'PNG' or 'JPEG'.
+    :type image_format: str
+    :param max_dimension: A smaller limit to apply. (default is DEFAULT_MAX_DIMENSION)
+    :type max_dimension: int
+    :return: int
+    """
+    max_dimension = max_dimension or DEFAULT_MAX_DIMENSION
+    return min(max_dimension, FORMAT_MAX_DIMENSIONS.get((image_format or '').upper(), max_dimension))
+
+
+def plan_shards(image_array, orientation='vertical', alignment='left', normalize=False,
+                max_dimension=DEFAULT_MAX_DIMENSION, max_bytes=None, **trim_options):
+    """
+    Splits a composition into parts along the direction the images are stacked. Parts are filled greedily
+    and never cut through an image, so an image that is over the limits on its own gets a part to itself.
+    The layout is computed once for the whole composition, so alignment and scaling match across parts.
+    :param image_array: The images to be stacked, in order.
+    :type image_array: list(Model.ImageThumbItem or Model.ImageSource)
+    :param max_dimension: The largest length a part may have along the stacking direction.
+    :type max_dimension: int
+    :param max_bytes: The largest canvas, in bytes, a part may need. (default is no limit)
+    :type max_bytes: int
+    :param trim_options: trim, trim_tolerance and trim_sides, as accepted by Controller.compute_layout.
+        The remaining parameters are the same as Controller.create_composite_image.
+    :return: tuple - The (width, height) of the whole composition and a list of Shards.
+    """
+    is_vert = orientation == 'vertical'
+    axis = 1 if is_vert else 0
+    sizes = [Controller._read_size(img) for img in image_array]
+    canvas_size, placements = Controller.compute_layout(image_array, orientation, alignment, normalize,
+                                                        sizes=sizes, **trim_options)
+    cross = canvas_size[0] if is_vert else canvas_size[1]
+    max_length = max_dimension or canvas_size[axis]
+    if max_bytes:
+        max_length = min(max_length, max_bytes // max(1, cross * CANVAS_BYTES_PER_PIXEL))
+
+    runs = []
+    for position, (img, box, crop) in enumerate(placements):
+        if runs and box[axis + 2] - placements[runs[-1][0]][1][axis] <= max_length:
+            runs[-1].append(position)
+        else:
+            runs.append([position])
+
+    shards = []
+    for index, run in enumerate(runs):
+        start = placements[run[0]][1][axis]
+        end = placements[run[-1]][1][axis + 2]
+        offset = (0, start) if is_vert else (start, 0)
+        shard_placements = [(img, (box[0] - offset[0], box[1] - offset[1], box[2] - offset[0], box[3] - offset[1]),
+                             crop) for img, box, crop in (placements[position] for position in run)]
+        shards.append(Shard(index, offset, (cross, end - start) if is_vert else (end - start, cross),
+                            shard_placements, [sizes[position] for position in run]))
+    return canvas_size, shards
+
+
+def shard_path(output_path, index, count):
+    """
+    Names a part after the output file, e.g. stack.png becomes stack.001.png.
+    :param output_path: The file name of the whole composition.
+    :type output_path: str
+    :param index: The position of the part, starting at 0.
+    :type index: int
+    :param count: The number of parts.
+    :type count: int
+    :return: str
+    """
+    stem, extension = os.path.splitext(output_path)
+    return f'{stem}.{index + 1:0{max(3, len(str(count)))}}{extension}'
+
+
+def index_path(output_path):
+    """
+    Names the index file of a split composition, e.g. stack.png becomes stack.index.json.
+    :param output_path: The file name of the whole composition.
+    :type output_path: str
+    :return: str
+    """
+    return f'{os.path.splitext(output_path)[0]}.index.json'
+
+
+def write_shards(canvas_size, shards, output_path, image_format=None, orientation='vertical', workers=1,
+                 composite_options=None, temp_dir=None, encode_workers=None, **encode_options):
+    """
+    Builds and encodes the parts of a split composition in parallel, then writes an index file that lists
+    the parts in order with their position in the whole composition.
+    :param canvas_size: The width and height of the whole composition.
+    :type canvas_size: tuple(int, int)
+    :param shards: The parts from plan_shards.
+    :type shards: list(Shard)
+    :param output_path: The file name of the whole composition. Parts and the index are named after it.
+    :type output_path: str
+    :param image_format: A Pillow format name. (default is from the output file extension)
+    :type image_format: str
+    :param orientation: Recorded in the index. (default is 'vertical')
+    :type orientation: str
+    :param workers: The number of parts to build at the same time. (default is 1)
+    :type workers: int
+    :param composite_options: The backend and workers for Controller.stack_images for each part, such as
+        the backend and decoding workers chosen by ResourceGovernor.plan_parts. (default is the defaults)
+    :type composite_options: list(dict)
+    :param temp_dir: The directory for 'memmap' canvas files. (default is the system temp dir)
+    :type temp_dir: str
+    :param encode_workers: The number of PNG encoding threads for each part. (default is the number of CPUs
+        shared between the parts being built)
+    :type encode_workers: int
+    :param encode_options: png_level and png_chunk_rows, as accepted by Controller.write_image.
+    :return: str - The path of the index file.
+    """
+    image_format = image_format or Controller.format_for_path(output_path)
+    workers = max(1, min(workers, len(shards)))
+    encode_workers = encode_workers or max(1, (os.cpu_count() or 1) // workers)
+    composite_options = composite_options or [{} for _ in shards]
+    paths = [shard_path(output_path, shard.index, len(shards)) for shard in shards]
+
+    def write(shard, path, options):
+        image, release_rows = Controller._compose_for_writing(shard.size, shard.placements, temp_dir=temp_dir,
+                                                              **options)
+        with open(path, 'wb') as file_handle:
+            Controller.write_image(image, file_handle, image_format, workers=encode_workers,
+                                   release_rows=release_rows, **encode_options)
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(write, *task) for task in zip(shards, paths, composite_options)]:
+                future.result()
+    except Exception:
+        for path in paths:
+            if os.path.isfile(path):
+                os.remove(path)
+        raise
+
+    index = {
+        'size': list(canvas_size),
+        'orientation': orientation,
+        'format': image_format,
+        'parts': [{
+            'file': os.path.basename(path),
+            'offset': list(shard.offset),
+            'size': list(shard.size),
+            'images': [img.display_name for img, box, crop in shard.placements],
+        } for shard, path in zip(shards, paths)],
+    }
+    with open(index_path(output_path), 'w') as file_handle:
+        json.dump(index, file_handle, indent=2)
+    return index_path(output_path)
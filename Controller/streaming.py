@@ -0,0 +1,81 @@
+from bisect import bisect_left, bisect_right
+from PIL import Image
+import Controller
+
+# Name of the backend that streams a composition into the PNG encoder instead of building a canvas.
+STREAM_BACKEND = 'stream'
+
+
+class StreamingCanvas(object):
+    """
+    A composition that is put together one band of rows at a time as the PNG encoder reads it, instead of
+    being built in full first. Only the images that overlap the band being read are held decoded, so a tall
+    vertical stack needs little more memory than its largest images.
+    Pass it to Controller.png_writer.write_png in place of an image. Bands must be read from top to bottom.
+    """
+
+    mode = 'RGB'
+
+    def __init__(self, size, placements, workers=1):
+        """
+        :param size: The width and height of the composition.
+        :type size: tuple(int, int)
+        :param placements: The (image, box, crop) triples from Controller.compute_layout.
+        :type placements: list(tuple)
+        :param workers: The number of images to decode in parallel. (default is 1)
+        :type workers: int
+        """
+        self.size = size
+        self.width, self.height = size
+        self._boxes = [box for img, box, crop in placements]
+        # The top of the highest image still to come, so every image reaching a band is loaded before it.
+        self._next_tops = [0] * len(self._boxes)
+        highest = self.height
+        for position in range(len(self._boxes) - 1, -1, -1):
+            highest = min(highest, self._boxes[position][1])
+            self._next_tops[position] = highest
+        self._loaded = Controller._iter_loaded(placements, workers)
+        self._next = 0
+        self._active = []
+
+    def crop(self, box):
+        """
+        Builds a band of rows of the composition.
+        :param box: The (left, upper, right, lower) region. Apart from repeating the last row of the band
+            before it, it must not start above the previous band.
+        :type box: tuple(int, int, int, int)
+        :return: PIL.Image
+        """
+        left, top, right, bottom = box
+        while self._next < len(self._boxes) and self._next_tops[self._next] < bottom:
+            self._active.append(next(self._loaded))
+            self._next += 1
+
+        band = Image.new(self.mode, (right - left, bottom - top))
+        for image_box, image in self._active:
+            if image_box[1] < bottom and image_box[3] > top:
+                band.paste(image, (image_box[0] - left, image_box[1] - top))
+        # Keep the images that reach the last row, as the next band starts by repeating it.
+        self._active = [(image_box, image) for image_box, image in self._active if image_box[3] >= bottom]
+        return band
+
+
+def images_per_band(boxes, height, band_rows):
+    """
+    Counts the most images a StreamingCanvas holds at once while a composition is encoded in bands.
+    :param boxes: The (left, upper, right, lower) region of each image.
+    :type boxes: list(tuple)
+    :param height: The height of the composition.
+    :type height: int
+    :param band_rows: The number of rows in each band.
+    :type band_rows: int
+    :return: int
+    """
+    tops = sorted(box[1] for box in boxes)
+    bottoms = sorted(box[3] for box in boxes)
+    band_rows = max(1, band_rows)
+    most = 0
+    for top in range(0, height, band_rows):
+        # Each band also repeats the last row of the one before it.
+        most = max(most, bisect_left(tops, top + band_rows) - bisect_right(bottoms, top - 1))
+    return most
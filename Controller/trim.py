@@ -0,0 +1,94 @@
+from collections import Counter
+
+ALL_SIDES = 'tblr'
+BAND_ROWS = 512
+
+
+class TrimProfile(object):
+    """
+    Data class describing how far each row and column of an image strays from its border colour.
+    It is computed once per image; content boxes for any tolerance or set of sides are read from it
+    without decoding the image again.
+    """
+
+    def __init__(self, size, border_color, rows, columns):
+        """
+        :param size: The width and height of the image.
+        :param border_color: The RGB colour treated as empty margin.
+        :param rows: For each row, the largest difference from the border colour in any channel.
+        :param columns: For each column, the largest difference from the border colour in any channel.
+        """
+        self.size = size
+        self.border_color = border_color
+        self.rows = rows
+        self.columns = columns
+
+    def content_box(self, tolerance=0, sides=ALL_SIDES):
+        """
+        Finds the region of the image that is not uniform margin.
+        :param tolerance: Differences from the border colour up to this value still count as margin.
+        :type tolerance: int
+        :param sides: The sides to trim: any combination of 't'op, 'b'ottom, 'l'eft and 'r'ight.
+        :type sides: str
+        :return: tuple(int, int, int, int) - The (left, upper, right, lower) box to keep. The whole image
+            is kept if it is entirely margin.
+        """
+        content_rows = (self.rows > tolerance).nonzero()[0]
+        content_columns = (self.columns > tolerance).nonzero()[0]
+        width, height = self.size
+        if len(content_rows) == 0:
+            return 0, 0, width, height
+        return (int(content_columns[0]) if 'l' in sides else 0,
+                int(content_rows[0]) if 't' in sides else 0,
+                int(content_columns[-1]) + 1 if 'r' in sides else width,
+                int(content_rows[-1]) + 1 if 'b' in sides else height)
+
+
+def measure_borders(image):
+    """
+    Builds the TrimProfile for an image. The border colour is the most common of the four corner pixels.
+    :param image: The image to measure.
+    :type image: PIL.Image
+    :return: TrimProfile
+    """
+    import numpy
+
+    image = image.convert('RGB')
+    width, height = image.size
+    corners = [image.getpixel(point) for point in ((0, 0), (width - 1, 0), (0, height - 1), (width - 1, height - 1))]
+    border_color = Counter(corners).most_common(1)[0][0]
+
+    color = numpy.array(border_color, dtype=numpy.int16)
+    rows = []
+    columns = numpy.zeros(width, dtype=numpy.int16)
+    # Work through bands of rows so the int16 copy never covers the whole image.
+    for top in range(0, height, BAND_ROWS):
+        band = numpy.asarray(image.crop((0, top, width, min(top + BAND_ROWS, height))), dtype=numpy.int16)
+        difference = numpy.abs(band - color).max(axis=2)
+        rows.append(difference.max(axis=1))
+        columns = numpy.maximum(columns, difference.max(axis=0))
+    return TrimProfile(image.size, border_color, numpy.concatenate(rows), columns)
+
+
+def get_trim_profile(img):
+    """
+    Gets the TrimProfile of an image, measuring it the first time and caching it on the item.
+    :param img: The image.
+    :type img: Model.ImageThumbItem or Model.ImageSource
+    :return: TrimProfile
+    """
+    if getattr(img, 'trim_profile', None) is None:
+        with img.open() as img_handle:
+            img.trim_profile = measure_borders(img_handle)
+    return img.trim_profile
+
+
+def parse_sides(raw_sides):
+    """
+    Normalizes a string of side letters, such as 'tb' or 'LR', ignoring anything that is not a side.
+    :param raw_sides: The sides to trim.
+    :type raw_sides: str
+    :return: str
+    """
+    raw_sides = (raw_sides or '').lower()
+    return ''.join(side for side in ALL_SIDES if side in raw_sides)
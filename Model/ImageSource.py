@@ -0,0 +1,72 @@
+import io
+import os
+import threading
+from contextlib import contextmanager, nullcontext
+from PIL import Image
+
+
+class ImageSource(object):
+    """
+    Data class for an image to be stacked that does not need a thumbnail: a path, encoded bytes,
+    a binary file-like object or a PIL Image. Nothing is decoded until the image is opened.
+    """
+
+    def __init__(self, data, display_name=None):
+        """
+        Creates a new ImageSource.
+        :param data: The image. File-like objects that cannot seek, such as pipes, are read into memory.
+        :type data: str, os.PathLike, bytes, file-like object or PIL.Image
+        :param display_name: The name of the image to use in messages. (default is the file name, if any)
+        :type display_name: str
+        """
+        if isinstance(data, (str, os.PathLike)):
+            data = os.path.abspath(data)
+            full_name = data
+        elif isinstance(data, (bytes, bytearray, memoryview)):
+            data = bytes(data)
+            full_name = f'<bytes {id(self):x}>'
+        elif isinstance(data, Image.Image):
+            full_name = f'<image {id(self):x}>'
+        elif hasattr(data, 'read'):
+            if not _is_seekable(data):
+                data = data.read()
+            full_name = f'<stream {id(self):x}>'
+        else:
+            raise TypeError(f'Cannot stack an object of type {type(data).__name__}.')
+
+        self.data = data
+        # Used as a cache key, so it must be unique for anything that is not a file on disk.
+        self.full_name = full_name
+        self.display_name = display_name or getattr(data, 'name', None) or os.path.basename(full_name)
+        # Controller.trim.TrimProfile, measured the first time the image is trimmed.
+        self.trim_profile = None
+        # PIL images are the caller's own, so they must not be drafted (decoded at a reduced size) in place.
+        self.can_draft = not isinstance(data, Image.Image)
+        self._lock = threading.Lock()
+
+    def open(self):
+        """
+        Opens the image. Only the header is read until the pixel data is used.
+        :return: A context manager giving a PIL.Image.
+        """
+        if isinstance(self.data, str):
+            return Image.open(self.data)
+        if isinstance(self.data, bytes):
+            return Image.open(io.BytesIO(self.data))
+        if isinstance(self.data, Image.Image):
+            return nullcontext(self.data)
+        return self._open_stream()
+
+    @contextmanager
+    def _open_stream(self):
+        # Opening a stream moves its position, so only one thread may use it at a time.
+        with self._lock:
+            self.data.seek(0)
+            yield Image.open(self.data)
+
+
+def _is_seekable(stream):
+    try:
+        return stream.seekable()
+    except (AttributeError, ValueError):
+        return False
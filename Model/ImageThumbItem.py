@@ -1,3 +1,4 @@
+from PIL import Image
 
 
 class ImageThumbItem(object):
@@ -16,11 +17,26 @@ class ImageThumbItem(object):
         self.full_name = full_name
         self.thumbnail = thumbnail
 
-        self.q_thumb = self.thumbnail.toqpixmap()
+        self.q_thumb = None
+        # Controller.trim.TrimProfile, measured the first time the image is trimmed.
+        self.trim_profile = None
+        self.can_draft = True
+
+    def open(self):
+        """
+        Opens the image file. Only the header is read until the pixel data is used.
+        :return: PIL.Image - Use it in a with block so the file is closed.
+        """
+        return Image.open(self.full_name)
 
     def get_thumbnail(self):
         """
         Gets a QPixmap of the thumbnail that can be redily displayed in Qt Widgets.
+        The pixmap is created the first time a view asks for it.
         :return: QPixmap - A Qt compatible pixmap representation of the object.
         """
+        if self.q_thumb is None:
+            # Imported here so the model, and the Controller built on it, can be used without Qt.
+            from Presentation.qt_image import to_qpixmap
+            self.q_thumb = to_qpixmap(self.thumbnail)
         return self.q_thumb
@@ -15,6 +15,8 @@ from PySide2.QtGui import (QBrush, QColor, QConicalGradient, QCursor, QFont,
     QPixmap, QRadialGradient)
 from PySide2.QtWidgets import *
 
+from Presentation.tiled_preview import TiledPreviewView
+
 
 class Ui_MainWindow(object):
     def setupUi(self, MainWindow):
@@ -36,27 +38,13 @@ class Ui_MainWindow(object):
         self.groupBox.setMinimumSize(QSize(300, 300))
         self.verticalLayout = QVBoxLayout(self.groupBox)
         self.verticalLayout.setObjectName(u"verticalLayout")
-        self.scrollArea = QScrollArea(self.groupBox)
-        self.scrollArea.setObjectName(u"scrollArea")
-        self.scrollArea.setFrameShape(QFrame.NoFrame)
-        self.scrollArea.setFrameShadow(QFrame.Plain)
-        self.scrollArea.setWidgetResizable(True)
-        self.scrollAreaWidgetContents = QWidget()
-        self.scrollAreaWidgetContents.setObjectName(u"scrollAreaWidgetContents")
-        self.scrollAreaWidgetContents.setGeometry(QRect(0, 0, 280, 310))
-        self.horizontalLayout_4 = QHBoxLayout(self.scrollAreaWidgetContents)
-        self.horizontalLayout_4.setObjectName(u"horizontalLayout_4")
-        self.img_preview = QLabel(self.scrollAreaWidgetContents)
+        self.img_preview = TiledPreviewView(self.groupBox)
         self.img_preview.setObjectName(u"img_preview")
-        self.img_preview.setMinimumSize(QSize(0, 0))
         self.img_preview.setContextMenuPolicy(Qt.NoContextMenu)
-        self.img_preview.setTextFormat(Qt.PlainText)
-
-        self.horizontalLayout_4.addWidget(self.img_preview)
+        self.img_preview.setFrameShape(QFrame.NoFrame)
+        self.img_preview.setFrameShadow(QFrame.Plain)
 
-        self.scrollArea.setWidget(self.scrollAreaWidgetContents)
-
-        self.verticalLayout.addWidget(self.scrollArea)
+        self.verticalLayout.addWidget(self.img_preview)
 
 
         self.gridLayout.addWidget(self.groupBox, 0, 0, 1, 1)
@@ -103,7 +91,7 @@ class Ui_MainWindow(object):
         self.label_2 = QLabel(self.groupBox1)
         self.label_2.setObjectName(u"label_2")
 
-        self.formLayout.setWidget(5, QFormLayout.LabelRole, self.label_2)
+        self.formLayout.setWidget(8, QFormLayout.LabelRole, self.label_2)
 
         self.gridLayout_2 = QGridLayout()
         self.gridLayout_2.setObjectName(u"gridLayout_2")
@@ -155,12 +143,12 @@ class Ui_MainWindow(object):
         self.gridLayout_2.addWidget(self.lst_file_list, 0, 0, 1, 4)
 
 
-        self.formLayout.setLayout(5, QFormLayout.FieldRole, self.gridLayout_2)
+        self.formLayout.setLayout(8, QFormLayout.FieldRole, self.gridLayout_2)
 
         self.label_3 = QLabel(self.groupBox1)
         self.label_3.setObjectName(u"label_3")
 
-        self.formLayout.setWidget(7, QFormLayout.LabelRole, self.label_3)
+        self.formLayout.setWidget(10, QFormLayout.LabelRole, self.label_3)
 
         self.widget_2 = QWidget(self.groupBox1)
         self.widget_2.setObjectName(u"widget_2")
@@ -182,7 +170,7 @@ class Ui_MainWindow(object):
         self.horizontalLayout_2.addWidget(self.btn_save_as_browse)
 
 
-        self.formLayout.setWidget(7, QFormLayout.FieldRole, self.widget_2)
+        self.formLayout.setWidget(10, QFormLayout.FieldRole, self.widget_2)
 
         self.widget_3 = QWidget(self.groupBox1)
         self.widget_3.setObjectName(u"widget_3")
@@ -203,11 +191,11 @@ class Ui_MainWindow(object):
         self.horizontalLayout_3.addWidget(self.btn_export)
 
 
-        self.formLayout.setWidget(9, QFormLayout.SpanningRole, self.widget_3)
+        self.formLayout.setWidget(12, QFormLayout.SpanningRole, self.widget_3)
 
         self.verticalSpacer = QSpacerItem(40, 64, QSizePolicy.Minimum, QSizePolicy.Preferred)
 
-        self.formLayout.setItem(6, QFormLayout.LabelRole, self.verticalSpacer)
+        self.formLayout.setItem(9, QFormLayout.LabelRole, self.verticalSpacer)
 
         self.label_4 = QLabel(self.groupBox1)
         self.label_4.setObjectName(u"label_4")
@@ -237,6 +225,76 @@ class Ui_MainWindow(object):
 
         self.formLayout.setWidget(4, QFormLayout.FieldRole, self.widget_4)
 
+        self.label_5 = QLabel(self.groupBox1)
+        self.label_5.setObjectName(u"label_5")
+
+        self.formLayout.setWidget(5, QFormLayout.LabelRole, self.label_5)
+
+        self.chk_normalize_size = QCheckBox(self.groupBox1)
+        self.chk_normalize_size.setObjectName(u"chk_normalize_size")
+
+        self.formLayout.setWidget(5, QFormLayout.FieldRole, self.chk_normalize_size)
+
+        self.label_6 = QLabel(self.groupBox1)
+        self.label_6.setObjectName(u"label_6")
+
+        self.formLayout.setWidget(6, QFormLayout.LabelRole, self.label_6)
+
+        self.widget_5 = QWidget(self.groupBox1)
+        self.widget_5.setObjectName(u"widget_5")
+        self.horizontalLayout_6 = QHBoxLayout(self.widget_5)
+        self.horizontalLayout_6.setObjectName(u"horizontalLayout_6")
+        self.chk_trim = QCheckBox(self.widget_5)
+        self.chk_trim.setObjectName(u"chk_trim")
+
+        self.horizontalLayout_6.addWidget(self.chk_trim)
+
+        self.label_7 = QLabel(self.widget_5)
+        self.label_7.setObjectName(u"label_7")
+
+        self.horizontalLayout_6.addWidget(self.label_7)
+
+        self.spn_trim_tolerance = QSpinBox(self.widget_5)
+        self.spn_trim_tolerance.setObjectName(u"spn_trim_tolerance")
+        self.spn_trim_tolerance.setMaximum(255)
+        self.spn_trim_tolerance.setValue(8)
+
+        self.horizontalLayout_6.addWidget(self.spn_trim_tolerance)
+
+
+        self.formLayout.setWidget(6, QFormLayout.FieldRole, self.widget_5)
+
+        self.widget_trim_sides = QWidget(self.groupBox1)
+        self.widget_trim_sides.setObjectName(u"widget_trim_sides")
+        self.horizontalLayout_7 = QHBoxLayout(self.widget_trim_sides)
+        self.horizontalLayout_7.setObjectName(u"horizontalLayout_7")
+        self.chk_trim_top = QCheckBox(self.widget_trim_sides)
+        self.chk_trim_top.setObjectName(u"chk_trim_top")
+        self.chk_trim_top.setChecked(True)
+
+        self.horizontalLayout_7.addWidget(self.chk_trim_top)
+
+        self.chk_trim_bottom = QCheckBox(self.widget_trim_sides)
+        self.chk_trim_bottom.setObjectName(u"chk_trim_bottom")
+        self.chk_trim_bottom.setChecked(True)
+
+        self.horizontalLayout_7.addWidget(self.chk_trim_bottom)
+
+        self.chk_trim_left = QCheckBox(self.widget_trim_sides)
+        self.chk_trim_left.setObjectName(u"chk_trim_left")
+        self.chk_trim_left.setChecked(True)
+
+        self.horizontalLayout_7.addWidget(self.chk_trim_left)
+
+        self.chk_trim_right = QCheckBox(self.widget_trim_sides)
+        self.chk_trim_right.setObjectName(u"chk_trim_right")
+        self.chk_trim_right.setChecked(True)
+
+        self.horizontalLayout_7.addWidget(self.chk_trim_right)
+
+
+        self.formLayout.setWidget(7, QFormLayout.FieldRole, self.widget_trim_sides)
+
 
         self.gridLayout.addWidget(self.groupBox1, 0, 1, 1, 1)
 
@@ -257,7 +315,6 @@ class Ui_MainWindow(object):
     def retranslateUi(self, MainWindow):
         MainWindow.setWindowTitle(QCoreApplication.translate("MainWindow", u"Screenshot Stacker", None))
         self.groupBox.setTitle(QCoreApplication.translate("MainWindow", u"Preview", None))
-        self.img_preview.setText("")
         self.groupBox1.setTitle(QCoreApplication.translate("MainWindow", u"Options", None))
         self.label.setText(QCoreApplication.translate("MainWindow", u"Orientation", None))
         self.opt_orientation_vertical.setText(QCoreApplication.translate("MainWindow", u"Vertical", None))
@@ -275,5 +332,23 @@ class Ui_MainWindow(object):
         self.opt_align_left.setText(QCoreApplication.translate("MainWindow", u"Left", None))
         self.opt_align_center.setText(QCoreApplication.translate("MainWindow", u"Center", None))
         self.opt_align_right.setText(QCoreApplication.translate("MainWindow", u"Right", None))
+        self.label_5.setText(QCoreApplication.translate("MainWindow", u"Scaling", None))
+#if QT_CONFIG(tooltip)
+        self.chk_normalize_size.setToolTip(QCoreApplication.translate("MainWindow", u"Scale every image to the same width (vertical) or height (horizontal).", None))
+#endif // QT_CONFIG(tooltip)
+        self.chk_normalize_size.setText(QCoreApplication.translate("MainWindow", u"Normalize size", None))
+        self.label_6.setText(QCoreApplication.translate("MainWindow", u"Trim", None))
+#if QT_CONFIG(tooltip)
+        self.chk_trim.setToolTip(QCoreApplication.translate("MainWindow", u"Remove uniform margins from each image before stacking.", None))
+#endif // QT_CONFIG(tooltip)
+        self.chk_trim.setText(QCoreApplication.translate("MainWindow", u"Trim borders", None))
+        self.label_7.setText(QCoreApplication.translate("MainWindow", u"Tolerance", None))
+#if QT_CONFIG(tooltip)
+        self.spn_trim_tolerance.setToolTip(QCoreApplication.translate("MainWindow", u"How far a pixel may differ from the border colour and still be trimmed.", None))
+#endif // QT_CONFIG(tooltip)
+        self.chk_trim_top.setText(QCoreApplication.translate("MainWindow", u"Top", None))
+        self.chk_trim_bottom.setText(QCoreApplication.translate("MainWindow", u"Bottom", None))
+        self.chk_trim_left.setText(QCoreApplication.translate("MainWindow", u"Left", None))
+        self.chk_trim_right.setText(QCoreApplication.translate("MainWindow", u"Right", None))
     # retranslateUi
 
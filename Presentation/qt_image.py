@@ -0,0 +1,97 @@
+from PIL import Image
+from PySide2 import QtGui
+
+# Pillow mode -> (QImage format, bytes per pixel)
+_QIMAGE_FORMATS = {
+    'RGB': (QtGui.QImage.Format_RGB888, 3),
+    'RGBA': (QtGui.QImage.Format_RGBA8888, 4),
+    'RGBX': (QtGui.QImage.Format_RGBX8888, 4),
+    'L': (QtGui.QImage.Format_Grayscale8, 1),
+}
+
+# Array channel count -> Pillow mode. A fourth channel may be alpha or padding, so its mode must be given.
+_ARRAY_MODES = {1: 'L', 3: 'RGB'}
+
+
+class BufferedQImage(QtGui.QImage):
+    """
+    A QImage that draws its pixels straight from a Python buffer instead of owning a copy.
+    QImage does not take a reference to the memory it is given, so the buffer is held here for as long
+    as this object is alive. Use QPixmap.fromImage() or copy() before handing the image to Qt code that
+    keeps it after this wrapper has been released.
+    """
+
+    def __init__(self, buffer, width, height, bytes_per_line, image_format):
+        """
+        Wraps a buffer as a QImage.
+        :param buffer: An object that exposes the buffer protocol, such as bytes or a numpy array.
+        :param width: The width of the image in pixels.
+        :type width: int
+        :param height: The height of the image in pixels.
+        :type height: int
+        :param bytes_per_line: The length of a single row of the buffer in bytes.
+        :type bytes_per_line: int
+        :param image_format: The layout of each pixel.
+        :type image_format: QtGui.QImage.Format
+        """
+        super(BufferedQImage, self).__init__(buffer, width, height, bytes_per_line, image_format)
+        self._buffer = buffer
+
+
+def _normalize_mode(image):
+    """
+    Converts an image to the closest mode that maps directly onto a QImage format.
+    :param image: The image to convert.
+    :type image: PIL.Image
+    :return: PIL.Image
+    """
+    if image.mode in _QIMAGE_FORMATS:
+        return image
+    if image.mode in ('LA', 'PA', 'RGBa', 'La') or 'transparency' in image.info:
+        return image.convert('RGBA')
+    if image.mode in ('1', 'I;16', 'I', 'F'):
+        return image.convert('L')
+    return image.convert('RGB')
+
+
+def to_qimage(image, mode=None):
+    """
+    Wraps an image as a QImage without converting its pixel format.
+    RGB, RGBA, RGBX and L images are used as they are; any other mode is converted first.
+    Pillow does not guarantee that its pixel storage is contiguous, so a PIL image is always copied once,
+    by a single tobytes() call, and the QImage uses that copy. Only a C-contiguous uint8 numpy array of
+    shape (h, w), (h, w, 3) or (h, w, 4) is shared without any copy at all.
+    :param image: The image to wrap.
+    :type image: PIL.Image or numpy.ndarray
+    :param mode: The Pillow mode of an array's pixels. Required for 4 channels, which can be 'RGBA' or
+        'RGBX' (the fourth byte is padding and the image is opaque). Ignored for PIL images.
+    :type mode: str
+    :return: BufferedQImage
+    """
+    if isinstance(image, Image.Image):
+        image = _normalize_mode(image)
+        image_format, depth = _QIMAGE_FORMATS[image.mode]
+        return BufferedQImage(image.tobytes(), image.width, image.height, image.width * depth, image_format)
+
+    channels = 1 if image.ndim == 2 else image.shape[2]
+    if str(image.dtype) != 'uint8' or channels not in (1, 3, 4) or not image.flags['C_CONTIGUOUS']:
+        raise ValueError('to_qimage requires a C-contiguous uint8 array with 1, 3 or 4 channels.')
+    mode = mode or _ARRAY_MODES.get(channels)
+    if mode not in _QIMAGE_FORMATS or _QIMAGE_FORMATS[mode][1] != channels:
+        raise ValueError('A {0} channel array cannot be shown as {1}; '
+                         'pass mode=\'RGBA\' or mode=\'RGBX\' for 4 channels.'.format(channels, mode))
+    height, width = image.shape[:2]
+    image_format, depth = _QIMAGE_FORMATS[mode]
+    return BufferedQImage(image, width, height, width * depth, image_format)
+
+
+def to_qpixmap(image, mode=None):
+    """
+    Converts an image to a QPixmap, copying the pixels into memory owned by Qt.
+    :param image: The image to convert.
+    :type image: PIL.Image or numpy.ndarray
+    :param mode: The Pillow mode of an array's pixels, as accepted by to_qimage.
+    :type mode: str
+    :return: QtGui.QPixmap
+    """
+    return QtGui.QPixmap.fromImage(to_qimage(image, mode))
@@ -0,0 +1,299 @@
+import threading
+from collections import OrderedDict, deque
+from PySide2 import QtWidgets, QtGui, QtCore
+from PySide2.QtCore import Qt, Signal, QThread
+from Presentation.qt_image import to_qimage
+
+
+class PreviewRenderer(QThread):
+    """
+    Worker thread that loads source images for a pyramid in the order they are requested.
+    source_loaded is emitted after each image so the view can paint it straight away.
+    Images that cannot be loaded are reported once with source_failed and never requested again,
+    so they stay placeholders. A cancelled renderer finishes the image it is decoding and then stops
+    without emitting.
+    """
+
+    source_loaded = Signal(object, int, int)
+    source_failed = Signal(object, int, object)
+
+    def __init__(self, pyramid, parent=None):
+        """
+        :param pyramid: The pyramid to load source images for.
+        :type pyramid: Controller.pyramid.ImagePyramid
+        """
+        super(PreviewRenderer, self).__init__(parent)
+        self.pyramid = pyramid
+        self._pending = deque()
+        self._queued = set()
+        self._failed = set()
+        self._cancelled = False
+        self._wake = threading.Condition()
+
+    def request(self, level, indices):
+        """
+        Queues images to be loaded at a pyramid level. Images that are already queued, or that failed
+        to load before, are skipped.
+        :param level: The pyramid level.
+        :type level: int
+        :param indices: The position of each image in the composition.
+        :type indices: iterable(int)
+        :return: None
+        """
+        with self._wake:
+            for index in indices:
+                if (index, level) not in self._queued and index not in self._failed:
+                    self._queued.add((index, level))
+                    self._pending.append((index, level))
+            self._wake.notify()
+
+    def is_idle(self):
+        """
+        Checks whether every requested image has been loaded.
+        :return: bool
+        """
+        with self._wake:
+            return not self._queued
+
+    def cancel(self):
+        """
+        Stops the renderer once the current image is done. Safe to call from any thread.
+        :return: None
+        """
+        with self._wake:
+            self._cancelled = True
+            self._pending.clear()
+            self._wake.notify()
+
+    def run(self):
+        while True:
+            with self._wake:
+                while not self._pending and not self._cancelled:
+                    self._wake.wait()
+                if self._cancelled:
+                    return
+                index, level = self._pending.popleft()
+
+            error = None
+            try:
+                if not self.pyramid.has_source(index, level):
+                    self.pyramid.load_source(index, level)
+            except Exception as exp:
+                error = exp
+
+            with self._wake:
+                self._queued.discard((index, level))
+                if error is not None:
+                    self._failed.add(index)
+                if self._cancelled:
+                    return
+            if error is None:
+                self.source_loaded.emit(self.pyramid, index, level)
+            else:
+                self.source_failed.emit(self.pyramid, index, error)
+
+
+class TiledPreviewItem(QtWidgets.QGraphicsItem):
+    """
+    Graphics item that paints a composition from an image pyramid. Only the tiles that intersect
+    the exposed area are drawn, taken from the pyramid level that matches the current zoom.
+    Painting never decodes images: missing ones are drawn as placeholders and passed to request_missing.
+    """
+
+    def __init__(self, pyramid, request_missing, image_cache_size=128, parent=None):
+        """
+        Creates a new preview item.
+        :param pyramid: The pyramid to draw tiles from.
+        :type pyramid: Controller.pyramid.ImagePyramid
+        :param request_missing: Called with (level, indices) for images that still need to be loaded.
+        :type request_missing: callable
+        :param image_cache_size: The number of tiles to keep as ready-to-draw QImages.
+        :type image_cache_size: int
+        """
+        super(TiledPreviewItem, self).__init__(parent)
+        self.pyramid = pyramid
+        self.request_missing = request_missing
+        self.image_cache_size = image_cache_size
+        self._images = OrderedDict()
+        self.setFlag(QtWidgets.QGraphicsItem.ItemUsesExtendedStyleOption, True)
+
+    def boundingRect(self):
+        return QtCore.QRectF(0, 0, self.pyramid.size[0], self.pyramid.size[1])
+
+    def paint(self, painter, option, widget=None):
+        scale = option.levelOfDetailFromTransform(painter.worldTransform())
+        level = self.pyramid.level_for_scale(scale)
+        span = self.pyramid.TILE_SIZE * 2 ** level
+        exposed = option.exposedRect
+
+        painter.setRenderHint(QtGui.QPainter.SmoothPixmapTransform, True)
+        for col, row in self.pyramid.tile_range(level, (exposed.left(), exposed.top(),
+                                                        exposed.right(), exposed.bottom())):
+            image, missing = self._image(level, col, row)
+            if missing:
+                self.request_missing(level, missing)
+            target = QtCore.QRectF(col * span, row * span,
+                                   image.width() * 2 ** level, image.height() * 2 ** level)
+            painter.drawImage(target, image, QtCore.QRectF(image.rect()))
+
+    def _image(self, level, col, row):
+        key = (level, col, row)
+        if key in self._images:
+            self._images.move_to_end(key)
+            return self._images[key], []
+
+        tile, missing = self.pyramid.try_tile(level, col, row)
+        image = to_qimage(tile)
+        if not missing:
+            self._images[key] = image
+            if len(self._images) > self.image_cache_size:
+                self._images.popitem(last=False)
+        return image, missing
+
+
+class TiledPreviewView(QtWidgets.QGraphicsView):
+    """
+    Scrollable, zoomable preview of a composition. Hold Ctrl and use the mouse wheel to zoom.
+    Images are loaded on a PreviewRenderer thread and painted one by one as they arrive.
+    source_failed is emitted with the image and the exception for each image of the current composition
+    that cannot be loaded.
+    """
+
+    source_failed = Signal(object, object)
+
+    ZOOM_STEP = 1.25
+    MIN_ZOOM = 1 / 64
+    MAX_ZOOM = 8.0
+
+    def __init__(self, parent=None):
+        super(TiledPreviewView, self).__init__(parent)
+        self.setScene(QtWidgets.QGraphicsScene(self))
+        self.setDragMode(QtWidgets.QGraphicsView.ScrollHandDrag)
+        self.setTransformationAnchor(QtWidgets.QGraphicsView.AnchorUnderMouse)
+        self.setViewportUpdateMode(QtWidgets.QGraphicsView.SmartViewportUpdate)
+        self._item = None
+        self._renderer = None
+        self._renderers = []
+
+    def has_pyramid(self):
+        return self._item is not None
+
+    def set_pyramid(self, pyramid, fit=True):
+        """
+        Replaces the composition shown in the view. Its visible images are loaded in the background,
+        in order, as they are painted. Any render still running for the previous composition is cancelled.
+        :param pyramid: The pyramid to display.
+        :type pyramid: Controller.pyramid.ImagePyramid
+        :param fit: Zoom to fit the width of the composition. Otherwise the current zoom is kept.
+        :type fit: bool
+        :return: None
+        """
+        self.clear()
+        self._renderer = PreviewRenderer(pyramid, self)
+        self._renderer.source_loaded.connect(self._source_loaded)
+        self._renderer.source_failed.connect(self._source_failed)
+        self._renderer.finished.connect(self._renderer_finished)
+        self._renderers.append(self._renderer)
+        self._renderer.start()
+
+        self._item = TiledPreviewItem(pyramid, self._renderer.request)
+        self.scene().addItem(self._item)
+        self.scene().setSceneRect(self._item.boundingRect())
+        if fit:
+            self.fit_width()
+
+    def clear(self):
+        """
+        Removes the composition from the view and cancels its render.
+        :return: None
+        """
+        self.cancel_render()
+        self.scene().clear()
+        self._item = None
+
+    def cancel_render(self):
+        """
+        Stops loading images for the current composition. What has been painted stays on screen.
+        :return: None
+        """
+        if self._renderer is not None:
+            self._renderer.cancel()
+            self._renderer = None
+
+    def is_rendering(self):
+        """
+        Checks whether images requested for the current composition are still being loaded.
+        :return: bool
+        """
+        return self._renderer is not None and not self._renderer.is_idle()
+
+    def shutdown(self):
+        """
+        Cancels every render and waits for the worker threads to exit.
+        :return: None
+        """
+        self.cancel_render()
+        for renderer in list(self._renderers):
+            renderer.cancel()
+            renderer.wait()
+
+    def _source_loaded(self, pyramid, index, level):
+        if self._item is None or self._item.pyramid is not pyramid:
+            return
+        box = pyramid.placements[index][1]
+        self._item.update(QtCore.QRectF(box[0], box[1], box[2] - box[0], box[3] - box[1]))
+
+    def _source_failed(self, pyramid, index, exp):
+        if self._item is None or self._item.pyramid is not pyramid:
+            return
+        self.source_failed.emit(pyramid.placements[index][0], exp)
+
+    def _renderer_finished(self):
+        renderer = self.sender()
+        if renderer in self._renderers:
+            self._renderers.remove(renderer)
+        renderer.deleteLater()
+
+    def zoom(self):
+        """
+        Gets the current zoom factor. 1.0 is full size.
+        :return: float
+        """
+        return self.transform().m11()
+
+    def set_zoom(self, factor):
+        """
+        Sets the zoom factor, limited to the range the view supports.
+        :param factor: The new zoom factor. 1.0 is full size.
+        :type factor: float
+        :return: None
+        """
+        factor = min(max(factor, self.MIN_ZOOM), self.MAX_ZOOM)
+        self.setTransform(QtGui.QTransform.fromScale(factor, factor))
+
+    def zoom_in(self):
+        self.set_zoom(self.zoom() * self.ZOOM_STEP)
+
+    def zoom_out(self):
+        self.set_zoom(self.zoom() / self.ZOOM_STEP)
+
+    def fit_width(self):
+        """
+        Zooms so the width of the composition fills the view. Compositions are never enlarged.
+        :return: None
+        """
+        if self._item is None:
+            return
+        width = self._item.boundingRect().width()
+        available = self.viewport().width() - self.verticalScrollBar().sizeHint().width()
+        self.set_zoom(min(1.0, available / width) if width > 0 else 1.0)
+
+    def wheelEvent(self, event):
+        if event.modifiers() & Qt.ControlModifier:
+            if event.angleDelta().y() > 0:
+                self.zoom_in()
+            else:
+                self.zoom_out()
+            event.accept()
+        else:
+            super(TiledPreviewView, self).wheelEvent(event)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Times Controller.create_composite_image with each compositor backend on a synthetic stack.
+
+Run from the repository root:
+    python -m Tools.benchmark_compositors --count 50 --width 1920 --height 1080
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from PIL import Image
+import Controller
+from Controller.compositors import COMPOSITORS
+from Model.ImageSource import ImageSource
+
+
+def make_images(directory, count, width, height):
+    """
+    Writes a set of solid colour PNGs with slightly different widths.
+    :return: list(Model.ImageSource)
+    """
+    images = []
+    for i in range(count):
+        path = os.path.join(directory, f'{i:04}.png')
+        Image.new('RGB', (width - (i % 7) * 10, height), ((i * 37) % 256, (i * 91) % 256, 128)).save(path)
+        images.append(ImageSource(path))
+    return images
+
+
+def run(images, backends, repeat, temp_dir):
+    """
+    Times each backend and returns the best wall clock time for each.
+    :return: dict(str, float)
+    """
+    results = {}
+    for backend in backends:
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            out_image = Controller.create_composite_image(images, alignment='center', backend=backend,
+                                                          temp_dir=temp_dir)
+            out_image.getpixel((0, 0))
+            elapsed = time.perf_counter() - start
+            del out_image
+            best = elapsed if best is None else min(best, elapsed)
+        results[backend] = best
+    return results
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description='Compare compositor backends.')
+    arg_parser.add_argument('-n', '--count', type=int, default=50, help='Number of images to stack.')
+    arg_parser.add_argument('--width', type=int, default=1920, help='Width of each image.')
+    arg_parser.add_argument('--height', type=int, default=1080, help='Height of each image.')
+    arg_parser.add_argument('-r', '--repeat', type=int, default=3, help='Runs per backend; the best is kept.')
+    arg_parser.add_argument('-b', '--backend', action='append', choices=list(COMPOSITORS),
+                            help='Backend to time. Repeat to time several (default is all of them).')
+    arg_parser.add_argument('--temp-dir', help='Directory for the memmap canvas.')
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        images = make_images(directory, args.count, args.width, args.height)
+        results = run(images, args.backend or list(COMPOSITORS), args.repeat, args.temp_dir)
+
+    baseline = results.get('pil')
+    print(f'{args.count} images of {args.width}x{args.height}')
+    for backend, elapsed in results.items():
+        relative = f'{baseline / elapsed:.2f}x' if baseline else ''
+        print(f'{backend:>8}  {elapsed:8.3f}s  {relative}')
+
+
+if __name__ == '__main__':
+    main()
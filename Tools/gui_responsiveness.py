@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Drives MainWindow offscreen through scripted add, preview, reorder, options and export sessions on a
+synthetic stack, and measures how long the GUI thread is blocked.
+
+Run from the repository root:
+    python -m Tools.gui_responsiveness --count 100 --width 1920 --height 1080 --budget-ms 100
+
+Exits with status 1 if any operation or event loop stall is longer than the budget.
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Must be set before Qt is loaded.
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from PIL import Image, ImageDraw
+from PySide2 import QtWidgets, QtCore
+import main
+
+HEARTBEAT_MS = 5
+POLL_MS = 10
+SETTLE_MS = 300
+
+
+class StallMonitor(QtCore.QObject):
+    """
+    Heartbeat timer on the GUI thread. Any tick that arrives late means the event loop was blocked,
+    and the delay is recorded as a stall against the current phase.
+    """
+
+    def __init__(self, interval_ms=HEARTBEAT_MS, parent=None):
+        """
+        :param interval_ms: How often the heartbeat should tick.
+        :type interval_ms: int
+        """
+        super(StallMonitor, self).__init__(parent)
+        self.interval_ms = interval_ms
+        self.phase = None
+        self.stalls = []
+        self._last_tick = None
+        self._timer = QtCore.QTimer(self)
+        self._timer.setTimerType(QtCore.Qt.PreciseTimer)
+        self._timer.setInterval(interval_ms)
+        self._timer.timeout.connect(self._tick)
+
+    def start(self):
+        self._last_tick = time.perf_counter()
+        self._timer.start()
+
+    def stop(self):
+        self._timer.stop()
+
+    def _tick(self):
+        now = time.perf_counter()
+        stall = (now - self._last_tick) * 1000 - self.interval_ms
+        # Ignore timer jitter; anything over a few ticks is a real stall.
+        if stall > self.interval_ms * 2:
+            self.stalls.append((self.phase, stall))
+        self._last_tick = now
+
+
+class PaintWatcher(QtCore.QObject):
+    """
+    Event filter that remembers when a widget was last painted.
+    """
+
+    def __init__(self, widget, parent=None):
+        super(PaintWatcher, self).__init__(parent)
+        self.last_paint = None
+        widget.installEventFilter(self)
+
+    def eventFilter(self, watched, event):
+        if event.type() == QtCore.QEvent.Paint:
+            self.last_paint = time.perf_counter()
+        return False
+
+
+class Session(object):
+    """
+    Runs scripted steps against a window and records how long each one blocked the GUI thread.
+    """
+
+    def __init__(self, app, window):
+        self.app = app
+        self.window = window
+        self.monitor = StallMonitor()
+        self.paint_watcher = PaintWatcher(window.ui.img_preview.viewport())
+        self.operations = []
+        self.first_paints = []
+        self.export_time = None
+
+    def call(self, phase, name, function, *args):
+        """
+        Runs one step on the GUI thread and records how long it took to return.
+        :return: The result of the step.
+        """
+        self.monitor.phase = phase
+        start = time.perf_counter()
+        result = function(*args)
+        self.operations.append((phase, name, (time.perf_counter() - start) * 1000))
+        return result
+
+    def wait(self, predicate=None, timeout_ms=60000, settle_ms=SETTLE_MS):
+        """
+        Runs the event loop until predicate returns True, then for settle_ms longer so debounced work runs.
+        :return: bool - False if the predicate was still not met after timeout_ms.
+        """
+        loop = QtCore.QEventLoop()
+        deadline = time.perf_counter() + timeout_ms / 1000
+        settle_until = [None]
+
+        def poll():
+            now = time.perf_counter()
+            if now > deadline:
+                loop.quit()
+            elif predicate is None or predicate():
+                if settle_until[0] is None:
+                    settle_until[0] = now + settle_ms / 1000
+                elif now >= settle_until[0]:
+                    loop.quit()
+            else:
+                settle_until[0] = None
+
+        poller = QtCore.QTimer()
+        poller.timeout.connect(poll)
+        poller.start(POLL_MS)
+        loop.exec_()
+        poller.stop()
+        return predicate is None or predicate()
+
+    def wait_for_preview(self, phase, start):
+        """
+        Waits for the preview to be painted and then fully loaded, recording the time to first paint.
+        With trimming on, that includes measuring the image borders and laying the preview out again.
+        """
+        self.monitor.phase = phase
+        self.wait(lambda: self.paint_watcher.last_paint is not None and self.paint_watcher.last_paint > start,
+                  settle_ms=0)
+        if self.paint_watcher.last_paint is not None and self.paint_watcher.last_paint > start:
+            self.first_paints.append((phase, (self.paint_watcher.last_paint - start) * 1000))
+        self.wait(lambda: not self.window.ui.img_preview.is_rendering() and not self.window.preview_timer.isActive()
+                  and not self.window.is_measuring_trim())
+
+
+def make_images(directory, count, width, height):
+    """
+    Writes a set of synthetic screenshots: a plain margin around blocks of colour and text-like bars.
+    Every third image is a JPEG so both decoders are exercised.
+    :return: list(str) - The path to each image.
+    """
+    paths = []
+    for i in range(count):
+        size = (width - (i % 5) * 40, height - (i % 3) * 30)
+        image = Image.new('RGB', size, (240, 240, 240))
+        draw = ImageDraw.Draw(image)
+        draw.rectangle((20, 20, size[0] - 21, 80), fill=((i * 37) % 256, (i * 91) % 256, 160))
+        for line in range(100, size[1] - 20, 24):
+            draw.rectangle((40, line, 40 + (line * 7 + i * 13) % (size[0] - 80), line + 10), fill=(60, 60, 60))
+        path = os.path.join(directory, f'{i:04}.{"jpg" if i % 3 == 2 else "png"}')
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+def run_sessions(session, paths, batch_size, moves, export_path):
+    """
+    Runs the scripted add, preview, reorder, options and export sessions in that order.
+    """
+    window = session.window
+    session.monitor.start()
+
+    start = time.perf_counter()
+    for first in range(0, len(paths), batch_size):
+        session.call('add', 'add_images', window.add_images, paths[first:first + batch_size])
+    session.wait(lambda: not window.is_loading_images(), settle_ms=0)
+    session.wait_for_preview('add', start)
+
+    start = time.perf_counter()
+    session.call('preview', 'btn_preview_clicked', window.btn_preview_clicked)
+    session.wait_for_preview('preview', start)
+    for _ in range(4):
+        session.call('preview', 'zoom_in', window.ui.img_preview.zoom_in)
+        session.wait()
+    scroll_bar = window.ui.img_preview.verticalScrollBar()
+    for step in range(1, 5):
+        session.call('preview', 'scroll', scroll_bar.setValue, scroll_bar.maximum() * step // 4)
+        session.wait(lambda: not window.ui.img_preview.is_rendering())
+    session.call('preview', 'fit_width', window.ui.img_preview.fit_width)
+    session.wait(lambda: not window.ui.img_preview.is_rendering())
+
+    file_list = window.ui.lst_file_list
+    for move in range(moves):
+        row = (move * 7) % max(1, window.model.rowCount() - 1) + 1
+        file_list.setCurrentIndex(window.model.index(row))
+        start = time.perf_counter()
+        session.call('reorder', 'btn_img_move_up_clicked', window.btn_img_move_up_clicked)
+        session.wait_for_preview('reorder', start)
+
+    ui = window.ui
+    for name, function, value in (('chk_trim', ui.chk_trim.setChecked, True),
+                                  ('spn_trim_tolerance', ui.spn_trim_tolerance.setValue, 24),
+                                  ('opt_orientation_horizontal', ui.opt_orientation_horizontal.setChecked, True),
+                                  ('opt_orientation_vertical', ui.opt_orientation_vertical.setChecked, True),
+                                  ('chk_trim', ui.chk_trim.setChecked, False)):
+        start = time.perf_counter()
+        session.call('options', name, function, value)
+        session.wait_for_preview('options', start)
+
+    window.ui.txt_save_as_path.setText(export_path)
+    start = time.perf_counter()
+    session.call('export', 'btn_export_clicked', window.btn_export_clicked)
+    session.wait(lambda: not window.is_exporting(), timeout_ms=600000, settle_ms=0)
+    session.export_time = (time.perf_counter() - start) * 1000
+
+    session.monitor.stop()
+
+
+def report(session, budget_ms):
+    """
+    Prints the worst blocking time of each phase.
+    :return: bool - True if everything stayed within the budget.
+    """
+    phases = []
+    for phase, name, elapsed in session.operations:
+        if phase not in phases:
+            phases.append(phase)
+
+    within_budget = True
+    print(f'{"phase":<10}{"ops":>6}{"worst op":>12}{"stalls":>8}{"worst stall":>14}{"p95 stall":>12}'
+          f'{"first paint":>14}')
+    for phase in phases:
+        operations = [entry for entry in session.operations if entry[0] == phase]
+        stalls = sorted(stall for stall_phase, stall in session.monitor.stalls if stall_phase == phase)
+        paints = [paint for paint_phase, paint in session.first_paints if paint_phase == phase]
+        worst_op = max(operations, key=lambda entry: entry[2])
+        worst_stall = stalls[-1] if stalls else 0.0
+        p95_stall = stalls[int(len(stalls) * 0.95)] if stalls else 0.0
+        first_paint = f'{max(paints):.1f} ms' if paints else '-'
+        print(f'{phase:<10}{len(operations):>6}{worst_op[2]:>9.1f} ms{len(stalls):>8}{worst_stall:>11.1f} ms'
+              f'{p95_stall:>9.1f} ms{first_paint:>14}')
+        if worst_op[2] > budget_ms or worst_stall > budget_ms:
+            within_budget = False
+            print(f'  over budget: {worst_op[1]} blocked for {worst_op[2]:.1f} ms, '
+                  f'longest stall {worst_stall:.1f} ms (budget {budget_ms} ms)')
+    if session.export_time is not None:
+        print(f'export finished in {session.export_time:.0f} ms')
+    return within_budget
+
+
+def main_harness():
+    arg_parser = argparse.ArgumentParser(description='Measure GUI thread stalls in scripted sessions.')
+    arg_parser.add_argument('-n', '--count', type=int, default=100, help='Number of images to stack.')
+    arg_parser.add_argument('--width', type=int, default=1920, help='Width of each image.')
+    arg_parser.add_argument('--height', type=int, default=1080, help='Height of each image.')
+    arg_parser.add_argument('--batch', type=int, default=10, help='Images added at a time.')
+    arg_parser.add_argument('--moves', type=int, default=10, help='Number of reorder steps.')
+    arg_parser.add_argument('--budget-ms', type=float, default=100, help='Longest the GUI thread may be blocked.')
+    args = arg_parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = make_images(directory, args.count, args.width, args.height)
+        window = main.MainWindow()
+        window.resize(1024, 768)
+        window.show()
+        session = Session(app, window)
+        session.wait(settle_ms=0)
+        run_sessions(session, paths, args.batch, args.moves, os.path.join(directory, 'export.png'))
+        window.close()
+
+    print(f'{args.count} images of {args.width}x{args.height}')
+    sys.exit(0 if report(session, args.budget_ms) else 1)
+
+
+if __name__ == '__main__':
+    main_harness()
@@ -9,8 +9,16 @@ from PySide2.QtCore import Qt, QTranslator, Signal, QObject, QThread, QThreadPoo
 from Presentation.gui_mainwindow import Ui_MainWindow
 import configparser
 import tempfile
+from collections import deque
 from Model.ImageSorterModel import ImageSorterModel
+from Model.ImageSource import ImageSource
 import Controller
+from Controller.pyramid import ImagePyramid, LruCache
+from Controller.compositors import COMPOSITORS
+from Controller.streaming import STREAM_BACKEND
+from Controller.governor import ResourceGovernor, ResourceBudgetError, config_int
+from Controller.trim import ALL_SIDES, get_trim_profile, parse_sides
+from Controller.sharding import FORMAT_MAX_DIMENSIONS, max_dimension_for, plan_shards, write_shards
 import logging
 import argparse
 import glob
@@ -19,6 +27,12 @@ import time
 
 THUMBNAIL_SIZE = 32
 CONFIG_FILE_PATH = 'config.ini'
+DEFAULT_MEMORY_BUDGET_MB = 1024
+DEFAULT_TILE_CACHE_SIZE = 256
+DEFAULT_SOURCE_CACHE_SIZE = 64
+DEFAULT_PNG_LEVEL = 6
+DEFAULT_PNG_CHUNK_ROWS = 256
+PREVIEW_DEBOUNCE_MS = 150
 STR_FILE_DIALOG_FILTER = 'Images (*.jpg *.jpeg *.jfif *.png *.tiff *tif *.bmp *.gif );;All Files (*)'
 
 
@@ -60,12 +74,50 @@ class MainWindow(QtWidgets.QMainWindow):
 
         self.ui.opt_orientation_horizontal.toggled.connect(self.opt_orientation_check_changed)
 
+        self.backend = kwargs.get('backend')
+        self.governor = kwargs.get('governor') or ResourceGovernor(DEFAULT_MEMORY_BUDGET_MB * 1024 * 1024)
+        self.tile_cache_size = kwargs.get('tile_cache_size', DEFAULT_TILE_CACHE_SIZE)
+        self.png_level = kwargs.get('png_level', DEFAULT_PNG_LEVEL)
+        self.png_chunk_rows = kwargs.get('png_chunk_rows', DEFAULT_PNG_CHUNK_ROWS)
+        self.preview_sources = LruCache(kwargs.get('source_cache_size', DEFAULT_SOURCE_CACHE_SIZE))
+
+        # Slow work runs on worker threads so the window keeps responding.
+        self._pending_images = deque()
+        self._image_loader = None
+        self._exporter = None
+        self._trim_measurer = None
+        # Paths of images whose borders could not be measured, so they are not tried again.
+        self._trim_failed = set()
+        # Images whose preview could not be loaded, so each one is only reported once.
+        self._preview_failures = set()
+        self.ui.img_preview.source_failed.connect(self._preview_source_failed)
+
+        # Re-render the preview shortly after the last change to the options or the image list.
+        self.preview_timer = QtCore.QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_DEBOUNCE_MS)
+        self.preview_timer.timeout.connect(self.refresh_preview)
+        for option in (self.ui.opt_orientation_horizontal, self.ui.opt_align_left, self.ui.opt_align_center,
+                       self.ui.opt_align_right, self.ui.chk_normalize_size, self.ui.chk_trim,
+                       self.ui.chk_trim_top, self.ui.chk_trim_bottom, self.ui.chk_trim_left, self.ui.chk_trim_right):
+            option.toggled.connect(self._schedule_preview)
+        self.ui.spn_trim_tolerance.valueChanged.connect(self._schedule_preview)
+        self.ui.chk_trim.toggled.connect(self.chk_trim_toggled)
+        self.model.layoutChanged.connect(self._schedule_preview)
+        self.model.rowsInserted.connect(self._schedule_preview)
+        self.model.rowsRemoved.connect(self._schedule_preview)
+        self.model.modelReset.connect(self._schedule_preview)
+
         for file_path in open_files:
             self.model.add_item(self._open_image(file_path))
 
         self._set_alignment(kwargs.get('alignment'))
         self._set_orientation(kwargs.get('orientation'))
-        kwargs.get('output_path')
+        self.ui.chk_normalize_size.setChecked(bool(kwargs.get('normalize')))
+        self._set_trim(kwargs.get('trim'), kwargs.get('trim_tolerance', Controller.DEFAULT_TRIM_TOLERANCE),
+                       kwargs.get('trim_sides', ALL_SIDES))
+        if kwargs.get('output_path') not in (None, '-'):
+            self.ui.txt_save_as_path.setText(kwargs['output_path'])
 
     def _set_orientation(self, orientation):
         if orientation == 'horizontal':
@@ -81,6 +133,25 @@ class MainWindow(QtWidgets.QMainWindow):
         else:
             self.ui.opt_align_left.setChecked(True)
 
+    def _set_trim(self, trim, tolerance, sides):
+        self.ui.chk_trim.setChecked(bool(trim))
+        self.ui.spn_trim_tolerance.setValue(tolerance)
+        for side, check_box in self._get_trim_side_boxes().items():
+            check_box.setChecked(side in sides)
+        self.chk_trim_toggled()
+
+    def _get_trim_side_boxes(self):
+        return {'t': self.ui.chk_trim_top, 'b': self.ui.chk_trim_bottom,
+                'l': self.ui.chk_trim_left, 'r': self.ui.chk_trim_right}
+
+    def chk_trim_toggled(self):
+        """
+        Enables the tolerance and side options only while trimming is turned on.
+        :return: None
+        """
+        self.ui.spn_trim_tolerance.setEnabled(self.ui.chk_trim.isChecked())
+        self.ui.widget_trim_sides.setEnabled(self.ui.chk_trim.isChecked())
+
     def opt_orientation_check_changed(self):
         """
         Changes the UI text on the alignment options to be more relevant to the selected orientation.
@@ -120,15 +191,52 @@ class MainWindow(QtWidgets.QMainWindow):
         open_dialog.setNameFilter(self.tr(STR_FILE_DIALOG_FILTER))
         open_dialog.open()
         if open_dialog.exec_():
-            file_names = open_dialog.selectedFiles()
-            print(file_names)
-            self._set_wait_cursor(True)
-            for f in file_names:
-                img = self._open_image(f)
-                if img is not None:
-                    self.model.add_item(img)
-            self._set_wait_cursor(False)
-        pass
+            self.add_images(open_dialog.selectedFiles())
+
+    def add_images(self, file_names):
+        """
+        Opens images in the background and appends each one to the composition as soon as it is ready.
+        Images are always added in the order they were requested.
+        :param file_names: The path to each image.
+        :type file_names: list(str)
+        :return: None
+        """
+        self.logger.debug(f'Adding {file_names}')
+        self._pending_images.extend(file_names)
+        self._start_image_loader()
+
+    def is_loading_images(self):
+        """
+        Checks whether images passed to add_images are still being opened.
+        :return: bool
+        """
+        return self._image_loader is not None or len(self._pending_images) > 0
+
+    def _start_image_loader(self):
+        if self._image_loader is not None or not self._pending_images:
+            return
+        self._set_wait_cursor(True)
+        self._image_loader = WorkerThread(_load_thumbnails, self._pending_images, parent=self)
+        self._image_loader.signals.progress.connect(self._image_loaded)
+        self._image_loader.finished.connect(self._image_loader_finished)
+        self._image_loader.start()
+
+    def _image_loaded(self, result):
+        file_name, img = result
+        if isinstance(img, Exception):
+            QtWidgets.QMessageBox.warning(self, 'Warning', f'Could not open {file_name}')
+            self.logger.warning(f'FAILED OPEN IMAGE \n{img}')
+        else:
+            self.model.add_item(img)
+
+    def _image_loader_finished(self):
+        self._image_loader.deleteLater()
+        self._image_loader = None
+        if self._pending_images:
+            # Images added after the loader had emptied the queue, but before it stopped.
+            self._start_image_loader()
+        else:
+            self._set_wait_cursor(self.is_exporting())
 
     def btn_img_remove_clicked(self):
         if self.model.rowCount() > 0:
@@ -204,41 +312,193 @@ class MainWindow(QtWidgets.QMainWindow):
         else:
             return 'vertical'
 
+    def _get_composition_options(self):
+        """
+        Gathers the layout options currently selected in the UI.
+        :return: dict - keyword arguments accepted by Controller.create_composite_image.
+        """
+        return {
+            'orientation': self._get_selected_orientation(),
+            'alignment': self._get_selected_alignment(),
+            'normalize': self.ui.chk_normalize_size.isChecked(),
+            'trim': self.ui.chk_trim.isChecked(),
+            'trim_tolerance': self.ui.spn_trim_tolerance.value(),
+            'trim_sides': ''.join(side for side, check_box in self._get_trim_side_boxes().items()
+                                  if check_box.isChecked()),
+        }
+
     def btn_preview_clicked(self):
         """
-        Generates a preview image.
+        Regenerates the preview straight away and zooms it to fit.
         :return: None
         """
-        self._set_wait_cursor(True)
         if self.model.rowCount() > 0:
-            self.logger.debug('Creating full size composition and storing in memory.')
-            self.full_composite_image = Controller.create_composite_image(self.model.imageList,
-                                                  orientation=self._get_selected_orientation(),
-                                                  alignment=self._get_selected_alignment())
-            self.logger.debug('Creating preview sized image and storing in memory.')
-            preview_sized_image = self.full_composite_image.reduce(2)
-            self.ui.img_preview.setPixmap(preview_sized_image.toqpixmap())
+            self.refresh_preview(fit=True)
         else:
             self.logger.debug('No images in composition.')
             QtWidgets.QMessageBox.information(self, "Information",
                                               "You must add at least 1 image to the composition before you can preview.")
-        self._set_wait_cursor(False)
 
-    def _save_image(self, export_path):
+    def _schedule_preview(self):
         """
-        Logic to save the composition as an image.
-        :param export_path: The absolute path to export the image.
+        Marks the preview as outdated. Any render in progress is cancelled, and a new one starts once
+        PREVIEW_DEBOUNCE_MS have passed without another change.
+        :return: None
+        """
+        self.ui.img_preview.cancel_render()
+        self.preview_timer.start()
+
+    def refresh_preview(self, fit=False):
+        """
+        Lays out the composition and starts painting the preview. Images are loaded in the background
+        and appear one at a time, so this returns as soon as the image headers have been read.
+        :param fit: Zoom to fit the composition. The zoom is always fitted the first time.
+        :type fit: bool
         :return: None
         """
-        self.logger.debug(f'Saving as "{export_path}".')
+        self.preview_timer.stop()
+        if self.model.rowCount() == 0:
+            self.ui.img_preview.clear()
+            return
+        self.logger.debug('Laying out the composition for the preview.')
+        options = self._get_composition_options()
+        if options['trim'] and self._start_trim_measurer():
+            # Shown untrimmed until every image's borders have been measured, then laid out again.
+            options['trim'] = False
         try:
-            with open(export_path, 'wb') as file_handle:
-                self.full_composite_image.save(file_handle)
-            self.logger.debug('File has been exported to disk.')
+            pyramid = ImagePyramid(self.model.imageList, tile_cache_size=self.tile_cache_size,
+                                   source_cache=self.preview_sources, **options)
         except Exception as exp:
-            self.logger.error(f"Failed to export image.\n{exp.with_traceback()}")
-            QtWidgets.QMessageBox.critical(self, "Error",
-                                           f'Failed to export the image.\nMessage:f{exp.with_traceback()}')
+            self.ui.img_preview.clear()
+            self._report_preview_failure(str(exp), f'Could not lay out the preview.\n{exp}')
+            return
+        self.ui.img_preview.set_pyramid(pyramid, fit=fit or not self.ui.img_preview.has_pyramid())
+
+    def is_measuring_trim(self):
+        """
+        Checks whether image borders are still being measured for a trimmed preview.
+        :return: bool
+        """
+        return self._trim_measurer is not None
+
+    def _start_trim_measurer(self):
+        """
+        Measures the borders of images that have not been trimmed before on a worker thread, as it
+        decodes every image in full.
+        :return: bool - True if borders are still being measured.
+        """
+        if self._trim_measurer is not None:
+            return True
+        images = [img for img in self.model.imageList
+                  if img.trim_profile is None and img.full_name not in self._trim_failed]
+        if not images:
+            return False
+        self._trim_measurer = WorkerThread(_measure_trim_profiles, images, parent=self)
+        self._trim_measurer.signals.complete.connect(self._trim_measured)
+        self._trim_measurer.finished.connect(self._trim_measurer_finished)
+        self._trim_measurer.start()
+        return True
+
+    def _trim_measured(self, failed):
+        self._trim_failed.update(failed)
+
+    def _trim_measurer_finished(self):
+        self._trim_measurer.deleteLater()
+        self._trim_measurer = None
+        if self.ui.chk_trim.isChecked() and self.model.rowCount() > 0:
+            self.refresh_preview()
+
+    def _preview_source_failed(self, img, exp):
+        self._report_preview_failure(img.full_name, f'Could not preview {img.display_name}\n{exp}')
+
+    def _report_preview_failure(self, key, message):
+        """
+        Warns that the preview could not be drawn. Each failure is only reported once.
+        :param key: Identifies the failure, such as the path of the image.
+        :type key: str
+        :param message: The warning to show.
+        :type message: str
+        :return: None
+        """
+        if key in self._preview_failures:
+            return
+        self._preview_failures.add(key)
+        self.logger.warning(f'FAILED PREVIEW \n{message}')
+        QtWidgets.QMessageBox.warning(self, 'Warning', message)
+
+    def closeEvent(self, event):
+        self.preview_timer.stop()
+        self.ui.img_preview.shutdown()
+        self._pending_images.clear()
+        for worker in (self._image_loader, self._exporter, self._trim_measurer):
+            if worker is not None:
+                worker.wait()
+        super(MainWindow, self).closeEvent(event)
+
+    def _save_image(self, export_path, split=False):
+        """
+        Logic to save the composition as an image. The composition is built and encoded on a worker thread.
+        :param export_path: The absolute path to export the image.
+        :param split: Save the composition as several parts with an index file. (default is False)
+        :type split: bool
+        :return: None
+        """
+        self.logger.debug(f'Saving as "{export_path}"{" in parts" if split else ""}.')
+        self._set_wait_cursor(True)
+        self.ui.btn_export.setEnabled(False)
+        self._exporter = WorkerThread(self._write_composition, list(self.model.imageList), export_path,
+                                      self._get_composition_options(), split, parent=self)
+        self._exporter.signals.complete.connect(self._export_complete)
+        self._exporter.signals.error.connect(lambda exp: self._export_failed(exp, export_path, split))
+        self._exporter.finished.connect(self._exporter_finished)
+        self._exporter.start()
+
+    def is_exporting(self):
+        """
+        Checks whether an export is still running.
+        :return: bool
+        """
+        return self._exporter is not None
+
+    def _write_composition(self, progress, image_list, export_path, options, split):
+        """
+        Builds the composition and writes it to disk. Runs on the export worker thread.
+        :return: str - The path the image, or the index of its parts, was written to.
+        """
+        export_options = {'backend': self.backend, 'png_level': self.png_level, 'png_chunk_rows': self.png_chunk_rows}
+        image_format = Controller.format_for_path(export_path)
+        if split:
+            return export_parts(image_list, export_path, image_format, self.governor, options, **export_options)
+        export_to_file(image_list, export_path, image_format, self.governor, options, **export_options)
+        return export_path
+
+    def _export_complete(self, export_path):
+        self.logger.debug(f'File has been exported to "{export_path}".')
+
+    def _export_failed(self, exp, export_path, split):
+        if isinstance(exp, ResourceBudgetError) and not split:
+            self.logger.error(f'Refused to export image. {exp}')
+            ans = QtWidgets.QMessageBox.question(self, "Export in parts?",
+                                                 f'The composition is too large to export as one image.\n{exp}\n\n'
+                                                 f'Do you want to export it as several images instead?',
+                                                 defaultButton=QtWidgets.QMessageBox.Yes)
+            if ans == QtWidgets.QMessageBox.Yes:
+                self._save_image(export_path, split=True)
+        elif isinstance(exp, ResourceBudgetError):
+            self.logger.error(f'Refused to export image. {exp}')
+            QtWidgets.QMessageBox.warning(self, "Warning", f'The composition is too large to export.\n{exp}')
+        else:
+            self.logger.error(f"Failed to export image.\n{exp}")
+            QtWidgets.QMessageBox.critical(self, "Error", f'Failed to export the image.\nMessage: {exp}')
+
+    def _exporter_finished(self):
+        exporter = self.sender()
+        exporter.deleteLater()
+        # A failed export may already have been retried in parts.
+        if exporter is self._exporter:
+            self._exporter = None
+            self.ui.btn_export.setEnabled(True)
+            self._set_wait_cursor(self.is_loading_images())
 
     def _set_wait_cursor(self, should_show_wait=True):
         """
@@ -284,24 +544,192 @@ class ProgressSignals(QObject):
     complete = Signal(object)
 
 
-# Create the Worker Thread
 class WorkerThread(QThread):
+    """
+    Runs a command on a background thread. The command is called with a progress callback followed by args.
+    Its return value is emitted through complete, and any exception through error.
+    Slots connected to the signals from the GUI thread run on the GUI thread.
+    """
+
     def __init__(self, command, *args, parent=None):
         QThread.__init__(self, parent)
         # Instantiate signals and connect signals to the slots
         self.signals = ProgressSignals()
+        self.command = command
+        self.args = args
 
     def run(self):
-        # Do something on the worker thread
-        a = 1 + 1
-        # Emit signals whenever you want
         try:
-
-            self.signals.complete.emit({})
+            self.signals.complete.emit(self.command(self.signals.progress.emit, *self.args))
         except Exception as exp:
             self.signals.error.emit(exp)
 
 
+def _load_thumbnails(progress, file_names):
+    """
+    Opens queued images one at a time, reporting (path, ImageThumbItem or the exception raised) for each.
+    :param progress: Called with the result for each image.
+    :param file_names: The queue of paths to open. It may grow while the images are being opened.
+    :type file_names: collections.deque
+    :return: None
+    """
+    while True:
+        try:
+            file_name = file_names.popleft()
+        except IndexError:
+            return
+        try:
+            progress((file_name, Controller.create_thumb_item(file_name, size=THUMBNAIL_SIZE)))
+        except Exception as exp:
+            progress((file_name, exp))
+
+
+def _measure_trim_profiles(progress, images):
+    """
+    Measures the borders of each image for trimming. The result is kept on the image.
+    Images that cannot be read are skipped; laying out the composition reports them.
+    :param progress: Unused.
+    :param images: The images to measure.
+    :type images: list(Model.ImageThumbItem)
+    :return: list(str) - The path of each image that could not be measured.
+    """
+    failed = []
+    for img in images:
+        try:
+            get_trim_profile(img)
+        except Exception:
+            failed.append(img.full_name)
+    return failed
+
+
+def export_composition(image_array, stream, image_format, governor, options, backend=None,
+                       png_level=DEFAULT_PNG_LEVEL, png_chunk_rows=DEFAULT_PNG_CHUNK_ROWS):
+    """
+    Plans a composition with the resource governor, then builds it and writes it to a stream.
+    :param image_array: The images to be stacked, in order.
+    :type image_array: list(Model.ImageThumbItem or Model.ImageSource)
+    :param stream: A writable binary stream.
+    :param image_format: A Pillow format name, such as 'PNG' or 'JPEG'.
+    :type image_format: str
+    :param governor: Chooses the canvas and the number of decoding threads.
+    :type governor: Controller.governor.ResourceGovernor
+    :param options: The layout options accepted by Controller.create_composite_image.
+    :type options: dict
+    :param backend: A compositor backend to use instead of the one the governor picks.
+    :type backend: str
+    :return: None
+    :raises ResourceBudgetError: If the composition cannot be built within the memory budget, or is too
+        large for the format.
+    """
+    estimate = governor.estimate(image_array, **options)
+    limit = FORMAT_MAX_DIMENSIONS.get(image_format.upper())
+    if limit is not None and max(estimate.canvas_size) > limit:
+        raise ResourceBudgetError(f'The composition is {estimate.canvas_size[0]}x{estimate.canvas_size[1]} pixels, '
+                                  f'but a {image_format} image can be at most {limit} pixels wide or high. '
+                                  f'Split it into parts.')
+    plan = governor.plan(estimate, image_format, png_chunk_rows)
+    composite_options = plan.composite_options()
+    if backend is not None:
+        composite_options['backend'] = backend
+    logging.getLogger(__name__).debug(f'Creating full size composition using the {plan.strategy} strategy '
+                                      f'({composite_options["backend"]} canvas, {plan.workers} worker(s)).')
+    Controller.stack_images(image_array, stream, image_format, temp_dir=governor.temp_dir, png_level=png_level,
+                            png_chunk_rows=png_chunk_rows, encode_workers=governor.workers,
+                            **composite_options, **options)
+
+
+def export_to_file(image_array, export_path, image_format, governor, options, **export_options):
+    """
+    Runs export_composition into a file. The file is removed again if the export fails.
+    :return: None
+    """
+    try:
+        with open(export_path, 'wb') as file_handle:
+            export_composition(image_array, file_handle, image_format, governor, options, **export_options)
+    except Exception:
+        if os.path.isfile(export_path):
+            os.remove(export_path)
+        raise
+
+
+def export_parts(image_array, export_path, image_format, governor, options, max_dimension=None, max_bytes=None,
+                 backend=None, png_level=DEFAULT_PNG_LEVEL, png_chunk_rows=DEFAULT_PNG_CHUNK_ROWS):
+    """
+    Splits a composition into parts that are built and encoded in parallel, and writes an index file that
+    lists them in order. Parts are named after export_path, e.g. stack.001.png, stack.002.png and
+    stack.index.json.
+    :param max_dimension: The largest length a part may have along the stacking direction.
+        (default is the most the format allows, up to 65535)
+    :type max_dimension: int
+    :param max_bytes: The largest canvas, in bytes, a part may need. (default is the memory budget
+        shared between the governor's workers)
+    :type max_bytes: int
+    :return: str - The path of the index file.
+    :raises ResourceBudgetError: If a part cannot be built within the memory budget even on its own.
+    """
+    canvas_size, shards = plan_shards(image_array, max_dimension=max_dimension_for(image_format, max_dimension),
+                                      max_bytes=max_bytes or governor.memory_budget // governor.workers, **options)
+    limit = FORMAT_MAX_DIMENSIONS.get(image_format.upper())
+    for shard in shards:
+        if limit is not None and max(shard.size) > limit:
+            raise ResourceBudgetError(f'Part {shard.index + 1} is {shard.size[0]}x{shard.size[1]} pixels, but a '
+                                      f'{image_format} image can be at most {limit} pixels wide or high. '
+                                      f'Images are never cut in two, so use a format without this limit.')
+    parallel, plans = governor.plan_parts([governor.estimate_layout(shard.size, shard.placements, shard.sizes)
+                                           for shard in shards], image_format, png_chunk_rows)
+    composite_options = [plan.composite_options() for plan in plans]
+    for part_options in composite_options:
+        if backend is not None:
+            part_options['backend'] = backend
+    logging.getLogger(__name__).debug(f'Creating {len(shards)} parts, {parallel} at a time.')
+    return write_shards(canvas_size, shards, export_path, image_format, options['orientation'], workers=parallel,
+                        composite_options=composite_options, temp_dir=governor.temp_dir,
+                        encode_workers=max(1, governor.workers // parallel), png_level=png_level,
+                        png_chunk_rows=png_chunk_rows)
+
+
+def run_headless(files, output_path, image_format, governor, options, split=False, max_part_size=None,
+                 max_part_bytes=None, **export_options):
+    """
+    Stacks images from the command line without opening the GUI.
+    :param files: The path to each image. '-' reads an image from stdin.
+    :type files: list(str)
+    :param output_path: Where to write the composition. '-' writes it to stdout.
+    :type output_path: str
+    :param image_format: A Pillow format name. (default is from the output file extension, or PNG)
+    :type image_format: str
+    :param split: Write the composition as several parts and an index file, as export_parts does.
+    :type split: bool
+    :return: int - The exit status.
+    """
+    if not files:
+        print('No images to stack.', file=sys.stderr)
+        return 1
+    if split and output_path == '-':
+        print('A composition cannot be split into parts when it is written to stdout.', file=sys.stderr)
+        return 1
+    image_format = image_format or Controller.format_for_path(output_path)
+    try:
+        image_array = [ImageSource(sys.stdin.buffer, 'stdin') if f == '-' else ImageSource(f) for f in files]
+        if split:
+            print(export_parts(image_array, output_path, image_format, governor, options, max_part_size,
+                               max_part_bytes, **export_options))
+        elif output_path == '-':
+            export_composition(image_array, sys.stdout.buffer, image_format, governor, options, **export_options)
+            sys.stdout.buffer.flush()
+        else:
+            export_to_file(image_array, output_path, image_format, governor, options, **export_options)
+    except ResourceBudgetError as exp:
+        print(f'The composition is too large to export. {exp}', file=sys.stderr)
+        if not split and output_path != '-':
+            print('Use --split to export it in parts.', file=sys.stderr)
+        return 1
+    except (OSError, ValueError) as exp:
+        print(f'Failed to export the image. {exp}', file=sys.stderr)
+        return 1
+    return 0
+
+
 def write_default_config():
     config = configparser.ConfigParser()
     config['DEFAULT'] = {
@@ -309,9 +737,40 @@ def write_default_config():
         'log_level': 'info',
         'background_color': "000"
     }
+    config['performance'] = {
+        # The most memory a single export may use.
+        'memory_budget_mb': DEFAULT_MEMORY_BUDGET_MB,
+        # Images decoded in parallel. 0 uses one per CPU.
+        'workers': 0,
+        # Preview tiles and scaled source images kept in memory.
+        'tile_cache_size': DEFAULT_TILE_CACHE_SIZE,
+        'source_cache_size': DEFAULT_SOURCE_CACHE_SIZE,
+        # Where canvases too large for memory are kept. Empty uses the system temp dir.
+        'temp_dir': '',
+        # zlib level (0-9) and rows per parallel task for PNG exports.
+        'png_compression_level': DEFAULT_PNG_LEVEL,
+        'png_chunk_rows': DEFAULT_PNG_CHUNK_ROWS,
+    }
     with open(CONFIG_FILE_PATH, 'w') as cfgfile:
         config.write(cfgfile)
 
+
+def read_config(create=True):
+    """
+    Reads the config file, creating it with the default settings if it does not exist yet.
+    :param create: Write the default config file when there is none. Otherwise a missing file
+        leaves every setting at its default. (default is True)
+    :type create: bool
+    :return: configparser.ConfigParser
+    """
+    if create and not os.path.exists(CONFIG_FILE_PATH):
+        write_default_config()
+    config = configparser.ConfigParser()
+    config.read(CONFIG_FILE_PATH)
+    if not config.has_section('performance'):
+        config.add_section('performance')
+    return config
+
 def in_str(string, value):
     try:
         string.index(value)
@@ -325,10 +784,22 @@ def configure_args():
     #arg_parser.add_argument('-l', '--log', help='Write logs to file (default is stdout, stderr)')
     #arg_parser.add_argument('-L', '--log_level', help='Sets the program\'s log level', action='store_true')
     arg_parser.add_argument('-v',  '--verbose', help='Increase the amount of console output.', action='store_true')
-    arg_parser.add_argument('files', help='The path to one or more image files to be loaded.', nargs='*')
+    arg_parser.add_argument('files', help='The path to one or more image files to be loaded. Use - to read an image from stdin.', nargs='*')
     arg_parser.add_argument('-a', '--alignment', default='left', help="(T)op, (M)iddle, (B)ottom, (L)eft, (C)enter, (R)ight")
     arg_parser.add_argument('-d', '--orientation', default='vertical', help="(H)orizontal or (V)ertical" )
-    arg_parser.add_argument('-o', '--output', help="Output to the specified file.")
+    arg_parser.add_argument('-o', '--output', help="Output to the specified file without opening the GUI (unless -i is given). Use - for stdout.")
+    arg_parser.add_argument('-f', '--format', help="Image format of the output, such as PNG or JPEG. (default is from the output file extension, or PNG)")
+    arg_parser.add_argument('-n', '--normalize', help='Scale every image to a common width (vertical) or height (horizontal).', action='store_true')
+    arg_parser.add_argument('-t', '--trim', help='Remove uniform borders from each image before stacking.', action='store_true')
+    arg_parser.add_argument('--trim-tolerance', type=int, default=Controller.DEFAULT_TRIM_TOLERANCE, help='How far (0-255) a pixel may differ from the border colour and still be trimmed.')
+    arg_parser.add_argument('--trim-sides', default=ALL_SIDES, help='Sides to trim: any of (T)op, (B)ottom, (L)eft, (R)ight.')
+    arg_parser.add_argument('--split', help='Export the composition as several images, built in parallel, with an index file listing them in order. Images are never cut in two.', action='store_true')
+    arg_parser.add_argument('--max-part-size', type=int, help='Longest a part may be, in pixels, along the stacking direction. (default is the most the format allows, up to 65535)')
+    arg_parser.add_argument('--max-part-mb', type=int, help='Most memory the canvas of a part may need. (default is the memory budget shared between the workers)')
+    arg_parser.add_argument('-b', '--backend', choices=list(COMPOSITORS) + [STREAM_BACKEND], help="Canvas used to build the composition. 'memmap' keeps it on disk for stacks larger than memory, and 'stream' builds each band of a PNG as it is encoded. (default is chosen from the memory budget)")
+    arg_parser.add_argument('--temp-dir', help="Directory for the 'memmap' canvas file. Overrides the config file.")
+    arg_parser.add_argument('--png-level', type=int, choices=range(10), metavar='0-9', help='PNG compression level. Overrides the config file.')
+    arg_parser.add_argument('--png-chunk-rows', type=int, help='Rows compressed by each PNG encoding thread. Overrides the config file.')
 
 
 def parse_arg_alignment(raw_arg):
@@ -356,7 +827,10 @@ def parse_arg_orientation(raw_arg):
         return 'vertical'
 
 def parse_arg_outpath(raw_arg):
-    return os.path.join(os.path.curdir, f'{int(time.time())}.png')
+    if raw_arg is None or len(raw_arg.strip()) == 0:
+        return os.path.join(os.path.curdir, f'{int(time.time())}.png')
+    raw_arg = raw_arg.strip()
+    return raw_arg if raw_arg == '-' else os.path.abspath(raw_arg)
 
 
 if __name__ == '__main__':
@@ -366,25 +840,53 @@ if __name__ == '__main__':
     if len([i for i in args.files if in_str(i, '*') ]) > 0:
         print('Globbing ("*") is not supported. Please use exact paths only.')
         #exit()
-    #
-    # if not os.path.exists(CONFIG_FILE_PATH):
-    #     write_default_config()
-    # config = configparser.ConfigParser()
-    # config.read(CONFIG_FILE_PATH)
+
+    headless = bool(args.output) and not args.interactive
+    # Running headless never leaves a config file behind in the working directory.
+    config = read_config(create=not headless)
+    performance = config['performance']
+    governor = ResourceGovernor.from_config(performance)
+    if args.temp_dir:
+        governor.temp_dir = args.temp_dir
+
+    composition_options = {
+        'orientation': parse_arg_orientation(args.orientation),
+        'alignment': parse_arg_alignment(args.alignment),
+        'normalize': args.normalize,
+        'trim': args.trim,
+        'trim_tolerance': min(max(args.trim_tolerance, 0), 255),
+        'trim_sides': parse_sides(args.trim_sides),
+    }
+    export_options = {
+        'backend': args.backend,
+        'png_level': args.png_level if args.png_level is not None
+        else min(config_int(performance, 'png_compression_level', DEFAULT_PNG_LEVEL), 9),
+        'png_chunk_rows': args.png_chunk_rows or config_int(performance, 'png_chunk_rows', DEFAULT_PNG_CHUNK_ROWS,
+                                                            minimum=1),
+    }
+
+    if headless:
+        sys.exit(run_headless(args.files, parse_arg_outpath(args.output), args.format, governor,
+                              composition_options, split=args.split, max_part_size=args.max_part_size,
+                              max_part_bytes=args.max_part_mb and args.max_part_mb * 1024 * 1024,
+                              **export_options))
 
     # translator = QTranslator()
     # translator.load('i18n/fr_ca')
     extra_options = {
-        'orientation': parse_arg_orientation(args.orientation),
-        'alignment': parse_arg_alignment(args.alignment),
-        'output_path': parse_arg_outpath(args.output),
+        'output_path': parse_arg_outpath(args.output) if args.output else None,
+        'governor': governor,
+        'tile_cache_size': config_int(performance, 'tile_cache_size', DEFAULT_TILE_CACHE_SIZE, minimum=1),
+        'source_cache_size': config_int(performance, 'source_cache_size', DEFAULT_SOURCE_CACHE_SIZE, minimum=1),
         'verbose': args.verbose,
+        **composition_options,
+        **export_options,
     }
 
     app = QtWidgets.QApplication(sys.argv)
 
     # QtWidgets.QStyleFactory.keys()
-    #app.setStyle(config['DEFAULT']['style'])
+    app.setStyle(config['DEFAULT'].get('style', 'Fusion'))
     # app.installTranslator(translator)
 
     window = MainWindow(open_files=args.files, **extra_options)
@@ -0,0 +1,60 @@
+import unittest
+
+from Controller.governor import ResourceBudgetError, ResourceGovernor, JobEstimate, STRATEGY_MEMORY, \
+    STRATEGY_STREAMING, STRATEGY_OUT_OF_CORE
+from Controller.streaming import STREAM_BACKEND
+
+MB = 1024 * 1024
+
+
+def _estimate(canvas_size, image_size=(2000, 1000), count=20, boxes=None):
+    return JobEstimate(canvas_size, [image_size] * count, image_size[0] * image_size[1] * 4, image_size, boxes)
+
+
+class PlanTest(unittest.TestCase):
+
+    def test_strategies_by_budget(self):
+        estimate = _estimate((2000, 20000))
+        self.assertEqual(ResourceGovernor(1024 * MB, workers=2).plan(estimate).strategy, STRATEGY_MEMORY)
+        self.assertEqual(ResourceGovernor(100 * MB, workers=2).plan(estimate).strategy, STRATEGY_OUT_OF_CORE)
+
+    def test_estimates_stay_within_budget(self):
+        estimate = _estimate((2000, 20000))
+        for budget in (100 * MB, 200 * MB, 210 * MB, 1024 * MB):
+            for image_format in ('PNG', 'JPEG'):
+                try:
+                    plan = ResourceGovernor(budget, workers=4).plan(estimate, image_format)
+                except ResourceBudgetError:
+                    continue
+                with self.subTest(budget=budget, image_format=image_format):
+                    self.assertLess(plan.estimated_bytes, budget)
+
+    def test_tall_png_stacks_stream(self):
+        estimate = _estimate((2000, 20000), boxes=[(0, top, 2000, top + 1000) for top in range(0, 20000, 1000)])
+        plan = ResourceGovernor(120 * MB, workers=2).plan(estimate)
+        self.assertEqual((plan.strategy, plan.backend), (STRATEGY_STREAMING, STREAM_BACKEND))
+        self.assertLess(plan.estimated_bytes, 120 * MB)
+        # Only PNGs are encoded in bands, and without the boxes nothing is known about the bands.
+        self.assertNotEqual(ResourceGovernor(120 * MB, workers=2).plan(_estimate((2000, 20000))).strategy,
+                            STRATEGY_STREAMING)
+
+    def test_single_worker_png_is_encoded_by_pillow(self):
+        # The canvas is written by Pillow's encoder, which needs no memory of its own.
+        estimate = _estimate((1600, 2000), image_size=(1600, 200), count=10)
+        plan = ResourceGovernor(20 * MB, workers=1).plan(estimate)
+        self.assertEqual(plan.strategy, STRATEGY_MEMORY)
+        self.assertLess(plan.estimated_bytes, 20 * MB)
+
+    def test_image_the_size_of_the_budget_is_refused(self):
+        decode = 64 * MB
+        estimate = JobEstimate((4096, 10 ** 8), [(4096, 4096)], decode, (4096, 4096))
+        with self.assertRaises(ResourceBudgetError):
+            ResourceGovernor(decode, workers=1).plan(estimate)
+
+    def test_non_png_out_of_core_needs_the_canvas(self):
+        with self.assertRaises(ResourceBudgetError):
+            ResourceGovernor(100 * MB, workers=2).plan(_estimate((2000, 20000)), 'BMP')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import os
+import tempfile
+import unittest
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from PySide2 import QtWidgets
+
+import main
+from Tools import gui_responsiveness
+
+BUDGET_MS = 100
+
+
+class GuiResponsivenessTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+    def test_reduced_session_stays_within_budget(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = gui_responsiveness.make_images(directory, 10, 320, 240)
+            window = main.MainWindow()
+            window.resize(1024, 768)
+            window.show()
+            session = gui_responsiveness.Session(self.app, window)
+            session.wait(settle_ms=0)
+            export_path = os.path.join(directory, 'export.png')
+            gui_responsiveness.run_sessions(session, paths, 5, 2, export_path)
+            window.close()
+            self.assertTrue(os.path.exists(export_path))
+
+        self.assertTrue(session.operations)
+        self.assertTrue(gui_responsiveness.report(session, BUDGET_MS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import io
+import unittest
+from unittest import mock
+
+from PIL import Image, ImageChops, ImageDraw, JpegImagePlugin
+
+import Controller
+from Controller import _load_image, _scaled_size, compute_layout
+
+QUADRANT_COLORS = [(220, 30, 30), (30, 220, 30), (30, 30, 220), (220, 220, 30)]
+
+
+def _sources(sizes):
+    return [Controller.as_image_source(Image.new('RGB', size, (90, 90, 90))) for size in sizes]
+
+
+def _quadrants_jpeg(size=(800, 600)):
+    """
+    Encodes a JPEG whose quadrants are red, green, blue and yellow, from top left to bottom right.
+    """
+    width, height = size
+    image = Image.new('RGB', size)
+    draw = ImageDraw.Draw(image)
+    for index, color in enumerate(QUADRANT_COLORS):
+        left, top = index % 2 * width // 2, index // 2 * height // 2
+        draw.rectangle((left, top, left + width // 2 - 1, top + height // 2 - 1), fill=color)
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=95)
+    return output.getvalue()
+
+
+def _assert_close(test, actual, expected, tolerance=40):
+    test.assertTrue(all(abs(a - e) <= tolerance for a, e in zip(actual, expected)), f'{actual} != {expected}')
+
+
+class ScaledSizeTest(unittest.TestCase):
+
+    def test_keeps_the_aspect_ratio(self):
+        self.assertEqual(_scaled_size((400, 300), 200, True), (200, 150))
+        self.assertEqual(_scaled_size((400, 300), 150, False), (200, 150))
+        self.assertEqual(_scaled_size((333, 100), 100, True), (100, 30))
+
+    def test_never_scales_to_nothing(self):
+        self.assertEqual(_scaled_size((5000, 2), 100, True), (100, 1))
+        self.assertEqual(_scaled_size((2, 5000), 100, False), (1, 100))
+
+
+class NormalizeLayoutTest(unittest.TestCase):
+
+    def test_vertical_stacks_take_the_narrowest_width(self):
+        canvas_size, placements = compute_layout(_sources([(400, 300), (200, 100), (800, 200)]), normalize=True)
+        self.assertEqual(canvas_size, (200, 300))
+        self.assertEqual([box for img, box, crop in placements],
+                         [(0, 0, 200, 150), (0, 150, 200, 250), (0, 250, 200, 300)])
+
+    def test_horizontal_stacks_take_the_shortest_height(self):
+        canvas_size, placements = compute_layout(_sources([(400, 300), (200, 100), (800, 200)]), 'horizontal',
+                                                 normalize=True)
+        self.assertEqual(canvas_size, (733, 100))
+        self.assertEqual([box for img, box, crop in placements],
+                         [(0, 0, 133, 100), (133, 0, 333, 100), (333, 0, 733, 100)])
+
+    def test_images_are_loaded_at_their_scaled_size(self):
+        images = _sources([(400, 300), (200, 100)])
+        composite = Controller.create_composite_image(images, normalize=True)
+        self.assertEqual(composite.size, (200, 250))
+
+
+class LoadImageTest(unittest.TestCase):
+
+    def test_jpeg_draft_with_a_crop(self):
+        jpeg = _quadrants_jpeg()
+        # The top right quadrant, shrunk by 4 so that draft mode decodes at a reduced size.
+        crop, size = (400, 0, 800, 300), (100, 75)
+        draft = JpegImagePlugin.JpegImageFile.draft
+        with mock.patch.object(JpegImagePlugin.JpegImageFile, 'draft', autospec=True, side_effect=draft) as spy:
+            drafted = _load_image(Controller.as_image_source(jpeg), size, crop)
+        self.assertEqual(spy.call_args[0][1:], ('RGB', (200, 150)))
+        self.assertEqual(drafted.size, size)
+        for corner in ((1, 1), (98, 1), (1, 73), (98, 73)):
+            _assert_close(self, drafted.getpixel(corner), QUADRANT_COLORS[1])
+
+        full = Controller.as_image_source(jpeg)
+        full.can_draft = False
+        expected = _load_image(full, size, crop)
+        self.assertLessEqual(max(channel[1] for channel in ImageChops.difference(drafted, expected).getextrema()),
+                             40)
+
+    def test_crop_without_scaling(self):
+        image = _load_image(Controller.as_image_source(_quadrants_jpeg()), None, (0, 300, 400, 600))
+        self.assertEqual(image.size, (400, 300))
+        _assert_close(self, image.getpixel((200, 150)), QUADRANT_COLORS[2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import io
+import unittest
+
+import numpy
+from PIL import Image
+
+from Controller import png_writer
+
+
+def _sample_image(mode, width=301, height=517):
+    """
+    Builds an image with gradients, noise and flat areas so that every filter type is chosen somewhere.
+    """
+    rng = numpy.random.default_rng(len(mode))
+    channels = len(Image.new(mode, (1, 1)).getbands())
+    pixels = numpy.tile(numpy.linspace(0, 255, width, dtype=numpy.uint8)[None, :, None], (height, 1, channels))
+    pixels[::5] = rng.integers(0, 256, pixels[::5].shape, dtype=numpy.uint8)
+    pixels[:, ::7] = rng.integers(0, 256, pixels[:, ::7].shape, dtype=numpy.uint8)
+    pixels[height // 3:height // 2] = 200
+    if mode == 'L':
+        return Image.fromarray(pixels[..., 0], mode)
+    if mode == 'RGBX':
+        return Image.fromarray(pixels[..., :3], 'RGB').convert('RGBX')
+    return Image.fromarray(pixels, mode)
+
+
+class WritePngTest(unittest.TestCase):
+
+    def setUp(self):
+        self.min_pixels = png_writer.PARALLEL_MIN_PIXELS
+
+    def tearDown(self):
+        png_writer.PARALLEL_MIN_PIXELS = self.min_pixels
+
+    def _round_trip(self, image, **options):
+        stream = io.BytesIO()
+        png_writer.write_png(image, stream, **options)
+        stream.seek(0)
+        with Image.open(stream) as written:
+            written.load()
+            return written
+
+    def test_round_trip_in_bands(self):
+        png_writer.PARALLEL_MIN_PIXELS = 0
+        for mode in ('L', 'RGB', 'RGBA'):
+            for workers in (2, 3):
+                with self.subTest(mode=mode, workers=workers):
+                    image = _sample_image(mode)
+                    written = self._round_trip(image, chunk_rows=64, workers=workers)
+                    self.assertEqual(written.mode, mode)
+                    self.assertTrue(numpy.array_equal(numpy.asarray(written), numpy.asarray(image)))
+
+    def test_rgbx_is_written_as_rgb(self):
+        image = _sample_image('RGBX')
+        for workers in (1, 2):
+            with self.subTest(workers=workers):
+                written = self._round_trip(image, chunk_rows=50, workers=workers)
+                self.assertEqual(written.mode, 'RGB')
+                self.assertTrue(numpy.array_equal(numpy.asarray(written), numpy.asarray(image)[..., :3]))
+
+    def test_single_row_bands(self):
+        png_writer.PARALLEL_MIN_PIXELS = 0
+        image = _sample_image('RGB', width=17, height=9)
+        written = self._round_trip(image, chunk_rows=1, workers=4, level=9)
+        self.assertTrue(numpy.array_equal(numpy.asarray(written), numpy.asarray(image)))
+
+    def test_small_images_use_pillow(self):
+        image = _sample_image('RGB')
+        expected = io.BytesIO()
+        image.save(expected, format='PNG', compress_level=6)
+        for workers in (1, 4):
+            with self.subTest(workers=workers):
+                stream = io.BytesIO()
+                png_writer.write_png(image, stream, workers=workers)
+                self.assertEqual(stream.getvalue(), expected.getvalue())
+
+    def test_adler32_combine(self):
+        first, second = b'stacked ' * 1000, bytes(range(256)) * 300
+        self.assertEqual(png_writer._adler32_combine(png_writer.zlib.adler32(first), png_writer.zlib.adler32(second),
+                                                     len(second)),
+                         png_writer.zlib.adler32(first + second))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import os
+import unittest
+
+import numpy
+from PIL import Image
+
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+from PySide2 import QtGui, QtWidgets
+
+from Presentation.qt_image import to_qimage
+
+
+def _drawn_on_white(image):
+    """
+    Paints an image over a white background and returns the colour of its first pixel.
+    """
+    target = QtGui.QImage(image.width(), image.height(), QtGui.QImage.Format_RGB32)
+    target.fill(QtGui.QColor('white'))
+    painter = QtGui.QPainter(target)
+    painter.drawImage(0, 0, image)
+    painter.end()
+    return target.pixelColor(0, 0).getRgb()[:3]
+
+
+class ToQImageTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+
+    def test_arrays_are_shared(self):
+        pixels = numpy.zeros((4, 5, 3), numpy.uint8)
+        image = to_qimage(pixels)
+        pixels[0, 0] = (10, 20, 30)
+        self.assertEqual(image.pixelColor(0, 0).getRgb()[:3], (10, 20, 30))
+
+    def test_rgbx_padding_is_opaque(self):
+        pixels = numpy.zeros((4, 5, 4), numpy.uint8)
+        pixels[..., 0] = 200
+        self.assertEqual(_drawn_on_white(to_qimage(pixels, 'RGBX')), (200, 0, 0))
+        self.assertEqual(_drawn_on_white(to_qimage(pixels, 'RGBA')), (255, 255, 255))
+        self.assertEqual(_drawn_on_white(to_qimage(Image.new('RGBX', (3, 3), (200, 0, 0, 0)))), (200, 0, 0))
+
+    def test_four_channel_arrays_need_a_mode(self):
+        with self.assertRaises(ValueError):
+            to_qimage(numpy.zeros((4, 5, 4), numpy.uint8))
+        with self.assertRaises(ValueError):
+            to_qimage(numpy.zeros((4, 5, 3), numpy.uint8), 'RGBA')
+
+
+if __name__ == '__main__':
+    unittest.main()
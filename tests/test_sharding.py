@@ -0,0 +1,80 @@
+import unittest
+
+from PIL import Image, ImageChops
+
+import Controller
+from Controller.sharding import plan_shards, CANVAS_BYTES_PER_PIXEL
+
+
+def _sources(sizes):
+    """
+    Wraps a solid image of each size, each in its own colour.
+    """
+    return [Controller.as_image_source(Image.new('RGB', size, (37 * number % 256, 255 - 23 * number, 90)))
+            for number, size in enumerate(sizes)]
+
+
+def _tiled(canvas_size, shards):
+    """
+    Builds every part and places them at their offsets, as a viewer of the index would.
+    """
+    whole = Image.new('RGB', canvas_size)
+    for shard in shards:
+        whole.paste(Controller.compose_layout(shard.size, shard.placements), shard.offset)
+    return whole
+
+
+class PlanShardsTest(unittest.TestCase):
+
+    def test_parts_are_filled_greedily_up_to_the_largest_dimension(self):
+        images = _sources([(50, 40), (30, 40), (60, 30), (50, 50), (40, 20)])
+        canvas_size, shards = plan_shards(images, max_dimension=100)
+        self.assertEqual(canvas_size, (60, 180))
+        # The second part fills the limit exactly.
+        self.assertEqual([shard.offset for shard in shards], [(0, 0), (0, 80)])
+        self.assertEqual([shard.size for shard in shards], [(60, 80), (60, 100)])
+        self.assertEqual([[img for img, box, crop in shard.placements] for shard in shards],
+                         [images[:2], images[2:]])
+        self.assertEqual(shards[1].placements[1][1], (0, 30, 50, 80))
+        self.assertEqual(shards[1].sizes, [(60, 30), (50, 50), (40, 20)])
+
+    def test_parts_are_limited_by_canvas_bytes(self):
+        images = _sources([(100, 30)] * 6)
+        # Room for 70 rows of 100 pixels, so two images per part.
+        canvas_size, shards = plan_shards(images, max_bytes=70 * 100 * CANVAS_BYTES_PER_PIXEL)
+        self.assertEqual([shard.size for shard in shards], [(100, 60)] * 3)
+        canvas_size, shards = plan_shards(images, max_dimension=50, max_bytes=70 * 100 * CANVAS_BYTES_PER_PIXEL)
+        self.assertEqual(len(shards), 6)
+
+    def test_an_image_over_the_limit_gets_a_part_of_its_own(self):
+        images = _sources([(40, 30), (40, 250), (40, 30), (40, 30)])
+        canvas_size, shards = plan_shards(images, max_dimension=100)
+        self.assertEqual([shard.size for shard in shards], [(40, 30), (40, 250), (40, 60)])
+        self.assertEqual([shard.offset for shard in shards], [(0, 0), (0, 30), (0, 280)])
+
+    def test_horizontal_parts_are_offset_along_x(self):
+        images = _sources([(40, 30), (50, 60), (30, 20), (70, 40)])
+        canvas_size, shards = plan_shards(images, 'horizontal', 'center', max_dimension=100)
+        self.assertEqual(canvas_size, (190, 60))
+        self.assertEqual([shard.offset for shard in shards], [(0, 0), (90, 0)])
+        self.assertEqual([shard.size for shard in shards], [(90, 60), (100, 60)])
+        # Alignment comes from the whole composition, not from the part.
+        self.assertEqual(shards[1].placements[0][1], (0, 20, 30, 40))
+
+    def test_parts_tile_back_to_the_whole_composition(self):
+        sizes = [(40, 30), (90, 45), (25, 70), (60, 60), (80, 15), (45, 35)]
+        for orientation in ('vertical', 'horizontal'):
+            for alignment in ('left', 'center', 'right'):
+                for normalize in (False, True):
+                    with self.subTest(orientation=orientation, alignment=alignment, normalize=normalize):
+                        images = _sources(sizes)
+                        expected = Controller.create_composite_image(images, orientation, alignment, normalize)
+                        canvas_size, shards = plan_shards(images, orientation, alignment, normalize,
+                                                          max_dimension=100)
+                        self.assertGreater(len(shards), 1)
+                        self.assertEqual(canvas_size, expected.size)
+                        self.assertIsNone(ImageChops.difference(_tiled(canvas_size, shards), expected).getbbox())
+
+
+if __name__ == '__main__':
+    unittest.main()
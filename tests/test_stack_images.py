@@ -0,0 +1,81 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from PIL import Image
+
+import Controller
+
+COLORS = [(200, 30, 30), (30, 200, 30), (30, 30, 200), (200, 200, 30), (30, 200, 200)]
+
+
+class _Pipe(io.RawIOBase):
+    """
+    A readable stream that cannot seek, like stdin or a pipe.
+    """
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        return self._data.readinto(buffer)
+
+
+def _encoded(color, size=(40, 30)):
+    output = io.BytesIO()
+    Image.new('RGB', size, color).save(output, 'PNG')
+    return output.getvalue()
+
+
+class StackImagesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.temp_dir, 'first.png')
+        with open(self.path, 'wb') as file:
+            file.write(_encoded(COLORS[0]))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _stack(self, sources, **options):
+        output = io.BytesIO()
+        Controller.stack_images(sources, output, **options)
+        output.seek(0)
+        with Image.open(output) as image:
+            return image.convert('RGB')
+
+    def test_every_kind_of_source(self):
+        sources = [self.path, _encoded(COLORS[1]), io.BytesIO(_encoded(COLORS[2])), _Pipe(_encoded(COLORS[3])),
+                   Image.new('RGB', (40, 30), COLORS[4])]
+        image = self._stack(sources)
+        self.assertEqual(image.size, (40, 150))
+        self.assertEqual([image.getpixel((20, 15 + 30 * index)) for index in range(5)], COLORS)
+
+    def test_single_kinds(self):
+        for source in (self.path, _encoded(COLORS[0]), io.BytesIO(_encoded(COLORS[0])),
+                       _Pipe(_encoded(COLORS[0])), Image.new('RGB', (40, 30), COLORS[0])):
+            with self.subTest(source=type(source).__name__):
+                image = self._stack([source], orientation='horizontal', image_format='BMP')
+                self.assertEqual(image.size, (40, 30))
+                self.assertEqual(image.getpixel((0, 0)), COLORS[0])
+
+    def test_pil_images_are_not_changed(self):
+        source = Image.new('RGB', (400, 300), COLORS[0])
+        self._stack([source, Image.new('RGB', (100, 100))], normalize=True)
+        self.assertEqual(source.size, (400, 300))
+
+    def test_no_sources(self):
+        with self.assertRaises(ValueError):
+            Controller.stack_images([], io.BytesIO())
+        with self.assertRaises(TypeError):
+            Controller.stack_images([42], io.BytesIO())
+
+
+if __name__ == '__main__':
+    unittest.main()
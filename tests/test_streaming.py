@@ -0,0 +1,54 @@
+import io
+import unittest
+
+from PIL import Image, ImageChops
+
+import Controller
+from Controller.streaming import STREAM_BACKEND, images_per_band
+
+
+def _images():
+    """
+    Builds images of different sizes and colours, so that misplaced pixels show up.
+    """
+    sizes = [(120, 90), (80, 200), (150, 40), (60, 75)]
+    return [Image.new('RGB', size, (40 * number, 255 - 50 * number, 90)) for number, size in enumerate(sizes)]
+
+
+def _stacked(backend, **options):
+    output = io.BytesIO()
+    Controller.stack_images(_images(), output, backend=backend, png_chunk_rows=37, encode_workers=2, **options)
+    output.seek(0)
+    with Image.open(output) as image:
+        return image.convert('RGB')
+
+
+class StreamingCanvasTest(unittest.TestCase):
+
+    def test_matches_the_canvas(self):
+        for orientation in ('vertical', 'horizontal'):
+            for alignment in ('left', 'center'):
+                for workers in (1, 3):
+                    with self.subTest(orientation=orientation, alignment=alignment, workers=workers):
+                        options = {'orientation': orientation, 'alignment': alignment, 'workers': workers}
+                        expected = _stacked('pil', **options)
+                        streamed = _stacked(STREAM_BACKEND, **options)
+                        self.assertEqual(streamed.size, expected.size)
+                        self.assertIsNone(ImageChops.difference(streamed, expected).getbbox())
+
+    def test_only_writes_png(self):
+        with self.assertRaises(ValueError):
+            Controller.stack_images(_images(), io.BytesIO(), 'JPEG', backend=STREAM_BACKEND)
+
+
+class ImagesPerBandTest(unittest.TestCase):
+
+    def test_counts_the_images_a_band_reaches(self):
+        boxes = [(0, top, 10, top + 100) for top in range(0, 500, 100)]
+        self.assertEqual(images_per_band(boxes, 500, 100), 2)
+        self.assertEqual(images_per_band(boxes, 500, 250), 3)
+        self.assertEqual(images_per_band([(left, 0, left + 10, 100) for left in range(0, 50, 10)], 100, 30), 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+
+from PIL import Image, ImageDraw
+
+from Controller.trim import measure_borders, parse_sides
+
+
+def _framed_image(size=(120, 80), content=(30, 20, 90, 50), margin=(255, 255, 255), fill=(0, 0, 0)):
+    """
+    Builds an image of a solid box on a plain margin. The box covers content, as (left, upper, right, lower).
+    """
+    image = Image.new('RGB', size, margin)
+    ImageDraw.Draw(image).rectangle((content[0], content[1], content[2] - 1, content[3] - 1), fill=fill)
+    return image
+
+
+class MeasureBordersTest(unittest.TestCase):
+
+    def test_border_color_is_the_most_common_corner(self):
+        image = _framed_image(margin=(10, 20, 30))
+        image.putpixel((0, 0), (200, 0, 0))
+        profile = measure_borders(image)
+        self.assertEqual(profile.border_color, (10, 20, 30))
+        self.assertEqual(profile.size, (120, 80))
+
+    def test_rows_and_columns_hold_the_largest_difference(self):
+        profile = measure_borders(_framed_image(margin=(250, 250, 250), fill=(240, 250, 100)))
+        self.assertEqual(len(profile.rows), 80)
+        self.assertEqual(len(profile.columns), 120)
+        self.assertEqual(int(profile.rows[0]), 0)
+        self.assertEqual(int(profile.rows[20]), 150)
+        self.assertEqual(int(profile.columns[89]), 150)
+        self.assertEqual(int(profile.columns[90]), 0)
+
+    def test_tall_images_are_measured_in_bands(self):
+        image = _framed_image(size=(40, 1300), content=(5, 700, 30, 1210))
+        self.assertEqual(measure_borders(image).content_box(), (5, 700, 30, 1210))
+
+    def test_other_modes_are_converted(self):
+        image = _framed_image().convert('L')
+        self.assertEqual(measure_borders(image).content_box(), (30, 20, 90, 50))
+
+
+class ContentBoxTest(unittest.TestCase):
+
+    def test_trims_every_side(self):
+        self.assertEqual(measure_borders(_framed_image()).content_box(), (30, 20, 90, 50))
+
+    def test_trims_only_the_sides_asked_for(self):
+        profile = measure_borders(_framed_image())
+        self.assertEqual(profile.content_box(sides='t'), (0, 20, 120, 80))
+        self.assertEqual(profile.content_box(sides='b'), (0, 0, 120, 50))
+        self.assertEqual(profile.content_box(sides='lr'), (30, 0, 90, 80))
+        self.assertEqual(profile.content_box(sides=''), (0, 0, 120, 80))
+
+    def test_tolerance(self):
+        image = _framed_image(margin=(200, 200, 200), fill=(0, 0, 0))
+        # A faint shadow around the box counts as margin once the tolerance covers it.
+        ImageDraw.Draw(image).rectangle((10, 5, 109, 74), outline=(190, 200, 205))
+        profile = measure_borders(image)
+        self.assertEqual(profile.content_box(tolerance=9), (10, 5, 110, 75))
+        self.assertEqual(profile.content_box(tolerance=10), (30, 20, 90, 50))
+
+    def test_image_that_is_all_margin_is_kept_whole(self):
+        profile = measure_borders(Image.new('RGB', (64, 48), (12, 34, 56)))
+        self.assertEqual(profile.content_box(), (0, 0, 64, 48))
+        noisy = Image.new('RGB', (64, 48), (12, 34, 56))
+        noisy.putpixel((30, 20), (15, 34, 56))
+        self.assertEqual(measure_borders(noisy).content_box(tolerance=3), (0, 0, 64, 48))
+        self.assertEqual(measure_borders(noisy).content_box(tolerance=2), (30, 20, 31, 21))
+
+
+class ParseSidesTest(unittest.TestCase):
+
+    def test_keeps_known_sides_in_order(self):
+        self.assertEqual(parse_sides('RLxb'), 'blr')
+        self.assertEqual(parse_sides(None), '')
+
+
+if __name__ == '__main__':
+    unittest.main()